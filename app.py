@@ -1,18 +1,31 @@
 import os
-from flask import Flask, render_template, request, jsonify
+import atexit
+from flask import Flask, render_template, request, jsonify, Response
 from werkzeug.utils import secure_filename
 import PyPDF2
-from pdf2image import convert_from_bytes, convert_from_path
+from pdf2image import convert_from_bytes, pdfinfo_from_bytes
 import pytesseract
 from PIL import Image
 import re
 import json
-import tempfile
 import logging
+import logging.handlers
 import traceback
 import numpy as np
 import time
 import threading
+import multiprocessing
+import io
+import uuid
+import bisect
+import shutil
+import queue
+from contextlib import contextmanager
+import hashlib
+from types import MappingProxyType
+from collections import OrderedDict, deque, Counter, namedtuple
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, Future
+from concurrent.futures.process import BrokenProcessPool
 
 # Add PyMuPDF import
 try:
@@ -35,37 +48,397 @@ except ImportError:
 try:
     import easyocr
     EASYOCR_AVAILABLE = True
-    # Initialize reader once - this is slow but only happens at startup
-    print("Initializing EasyOCR model (this may take a few moments)...")
-    reader = None
-    
-    # Initialize the reader in a background thread to avoid blocking app startup
-    def init_reader():
-        global reader
-        reader = easyocr.Reader(['en'], gpu=False)  # Set gpu=True if you have a GPU
-    
-    threading.Thread(target=init_reader).start()
 except ImportError:
     EASYOCR_AVAILABLE = False
     print("WARNING: easyocr not installed. Will use pytesseract for OCR only.")
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
+# EasyOCR's recognizer entry point, used to recognize text lines from several pages in one batch.
+# It is internal to EasyOCR, so it is only used on the versions recognize_lines was checked
+# against; otherwise each page is recognized with readtext.
+EASYOCR_BATCHING_VERSIONS = ('1.7.',)
+easyocr_get_text = None
+if EASYOCR_AVAILABLE:
+    if getattr(easyocr, '__version__', '').startswith(EASYOCR_BATCHING_VERSIONS):
+        try:
+            from easyocr.recognition import get_text as easyocr_get_text
+        except ImportError:
+            pass
+    else:
+        print(f"WARNING: batched EasyOCR recognition is not supported on easyocr {getattr(easyocr, '__version__', 'unknown')}; "
+              "pages are recognized one at a time.")
+
+class StructuredFormatter(logging.Formatter):
+    """Formats each record as one JSON object per line."""
+    
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage()
+        }
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry)
+
+log_listener = None
+
+def configure_logging(log_file=None):
+    """Route all logging through a queue so handler I/O happens on a background thread.
+    
+    Configured with environment variables:
+    LOG_LEVEL       level for the app (default INFO)
+    LOG_LEVELS      per-subsystem levels (extract, ocr, pdf, tax or any logger name), e.g. "ocr=DEBUG,werkzeug=WARNING"
+    LOG_FORMAT      "text" or "json" (default text)
+    LOG_TRACE       "1" logs every extraction step at DEBUG
+    LOG_DOCUMENT_TEXT  "1" includes extracted document text in traces (redacted by default)
+    """
+    global log_listener
+    if log_listener is not None:
+        log_listener.stop()
+    else:
+        # Drain queued records before the interpreter exits
+        atexit.register(lambda: log_listener.stop())
+    
+    if os.environ.get('LOG_FORMAT', 'text') == 'json':
+        formatter = StructuredFormatter()
+    else:
+        formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    handlers = [logging.StreamHandler()]
+    if log_file:
+        handlers.append(logging.FileHandler(log_file))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    
+    log_queue = queue.SimpleQueue()
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    root.setLevel(logging.INFO)
+    log_listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    log_listener.start()
+    
+    app_logger = logging.getLogger(__name__)
+    app_logger.setLevel(os.environ.get('LOG_LEVEL', 'INFO').upper())
+    trace = os.environ.get('LOG_TRACE') == '1'
+    for subsystem_logger in SUBSYSTEM_LOGGERS.values():
+        subsystem_logger.setLevel(logging.DEBUG if trace else logging.NOTSET)
+    for setting in filter(None, os.environ.get('LOG_LEVELS', '').split(',')):
+        # Subsystem names, or any other logger name such as werkzeug
+        name, _, level = setting.partition('=')
+        name = name.strip()
+        target = SUBSYSTEM_LOGGERS[name] if name in SUBSYSTEM_LOGGERS else logging.getLogger(name)
+        target.setLevel(level.strip().upper())
+
 logger = logging.getLogger(__name__)
+# Subsystems whose levels can be set separately with LOG_LEVELS
+extract_logger = logger.getChild('extract')
+ocr_logger = logger.getChild('ocr')
+pdf_logger = logger.getChild('pdf')
+tax_logger = logger.getChild('tax')
+SUBSYSTEM_LOGGERS = {'extract': extract_logger, 'ocr': ocr_logger, 'pdf': pdf_logger, 'tax': tax_logger}
+LOG_DOCUMENT_TEXT = os.environ.get('LOG_DOCUMENT_TEXT') == '1'
+configure_logging()
+
+# Pipeline counters, exposed at /stats
+pipeline_stats = Counter()
+pipeline_stats_lock = threading.Lock()
+
+def record_stat(name, count=1):
+    """Increment a pipeline counter."""
+    with pipeline_stats_lock:
+        pipeline_stats[name] += count
+
+# Stage latency histograms, exposed at /metrics. Bucket upper bounds are in seconds.
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+stage_timings = {}  # stage -> {'buckets': per-bucket counts, 'sum': seconds, 'count': observations}
+
+def record_timing(stage, seconds):
+    """Add one observation to a stage latency histogram."""
+    index = bisect.bisect_left(STAGE_BUCKETS, seconds)
+    with pipeline_stats_lock:
+        histogram = stage_timings.get(stage)
+        if histogram is None:
+            histogram = stage_timings[stage] = {'buckets': [0] * len(STAGE_BUCKETS), 'sum': 0.0, 'count': 0}
+        if index < len(STAGE_BUCKETS):
+            histogram['buckets'][index] += 1
+        histogram['sum'] += seconds
+        histogram['count'] += 1
+
+@contextmanager
+def timed(stage):
+    """Record how long the enclosed block takes as one observation of a stage."""
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_timing(stage, time.perf_counter() - start_time)
 
 app = Flask(__name__)
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
 app.config['UPLOAD_FOLDER'] = 'uploads'
+app.config['JOB_WORKERS'] = int(os.environ.get('JOB_WORKERS', 2))  # Concurrent processing jobs
+app.config['MAX_PENDING_JOBS'] = int(os.environ.get('MAX_PENDING_JOBS', 50))  # Queued + running jobs
+app.config['FILE_WORKERS'] = int(os.environ.get('FILE_WORKERS', 4))  # Files extracted concurrently across all jobs
+app.config['UPLOAD_CONCURRENCY'] = int(os.environ.get('UPLOAD_CONCURRENCY', 2))  # Files of one upload extracted at once
+app.config['EASYOCR_READERS'] = int(os.environ.get('EASYOCR_READERS', 1))  # Warm EasyOCR readers shared by requests
+app.config['EASYOCR_LOAD'] = os.environ.get('EASYOCR_LOAD', 'eager')  # 'eager' loads at startup, 'lazy' on first use
+app.config['EASYOCR_WAIT_SECONDS'] = float(os.environ.get('EASYOCR_WAIT_SECONDS', 120))  # Max wait for a free reader
+app.config['EASYOCR_BATCH_SIZE'] = int(os.environ.get('EASYOCR_BATCH_SIZE', 32))  # Text lines per recognition batch, 0 = per page
+app.config['EASYOCR_BATCH_WAIT_MS'] = float(os.environ.get('EASYOCR_BATCH_WAIT_MS', 50))  # Max wait for a batch to fill
+app.config['EASYOCR_PAGE_THREADS'] = int(os.environ.get('EASYOCR_PAGE_THREADS', 4))  # Pages of a PDF batched together
+app.config['OCR_PROCESSES'] = int(os.environ.get('OCR_PROCESSES', 0))  # Page OCR worker processes, 0 = in-process
+app.config['DUPLICATE_DETECTION'] = os.environ.get('DUPLICATE_DETECTION', '1') == '1'  # Skip repeated documents in an upload
+app.config['EXTRACTION_CACHE_DIR'] = os.environ.get('EXTRACTION_CACHE_DIR', 'cache/extraction')
+app.config['EXTRACTION_CACHE_MAX_MB'] = int(os.environ.get('EXTRACTION_CACHE_MAX_MB', 200))  # 0 disables the cache
+app.config['TAX_TABLES_PATH'] = os.environ.get('TAX_TABLES_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tax_tables.json'))
+app.config['JOB_RETENTION_SECONDS'] = int(os.environ.get('JOB_RETENTION_SECONDS', 3600))  # Keep finished jobs for 1 hour
 
 # Ensure upload directory exists
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
 ALLOWED_EXTENSIONS = {'pdf', 'jpg', 'jpeg', 'png'}
 
+# PDF rasterization and OCR page limits
+OCR_DETECT_DPI = 72  # Low-resolution render of a first page, for duplicate detection
+OCR_BASE_DPI = 150  # First OCR pass
+OCR_REFINE_DPI = 300  # Re-read of low-confidence lines
+TESSERACT_DPI = 200  # Tesseract pages; it has no low-confidence re-read to recover detail lost at OCR_BASE_DPI
+OCR_MAX_DIMENSION = 2500  # Longest side of a rendered page, in pixels
+OCR_MIN_CONFIDENCE = 0.5  # EasyOCR lines below this are re-read at OCR_REFINE_DPI
+OCR_MAX_REFINED_REGIONS = 20  # Per page, bounds the cost of a poor scan
+IMAGE_MAX_DIMENSION = 3000  # Longest side of an uploaded image, in pixels
+EASYOCR_MAX_PAGES = 10
+TESSERACT_MAX_PAGES = 5
+PAGE_TEXT_MIN_CHARS = 50  # Pages with embedded images and less text-layer content than this are OCRed
+
+# Upload validation
+MAX_UPLOAD_BYTES = 10 * 1024 * 1024  # Per file
+MIME_SNIFF_BYTES = 2048  # Leading bytes python-magic needs to identify a PDF, JPEG or PNG
+ALLOWED_MIME_TYPES = ('application/pdf', 'image/jpeg', 'image/png')
+
 def allowed_file(filename):
     return '.' in filename and \
            filename.lower().rsplit('.', 1)[1] in ALLOWED_EXTENSIONS
 
+class UploadedDocument:
+    """An uploaded file read once into memory.
+    
+    Every stage after the upload works on views of the same buffer rather
+    than re-reading or copying the file.
+    """
+    
+    def __init__(self, filename, data, content_type=None):
+        self.filename = filename
+        self.data = data
+        self.content_type = content_type
+    
+    @property
+    def size(self):
+        return len(self.data)
+    
+    @property
+    def view(self):
+        """Zero-copy view of the document bytes."""
+        return memoryview(self.data)
+    
+    def stream(self):
+        """A file object over the document bytes; io.BytesIO shares an immutable bytes buffer until written to."""
+        return io.BytesIO(self.data)
+
+def read_upload(file, max_bytes=MAX_UPLOAD_BYTES):
+    """Read an uploaded file once. Returns an UploadedDocument, or None if it is larger than max_bytes.
+    
+    At most max_bytes + 1 bytes are read, so an oversized file is rejected
+    without buffering all of it.
+    """
+    with timed('upload_read'):
+        data = file.read(max_bytes + 1)
+    if len(data) > max_bytes:
+        return None
+    return UploadedDocument(file.filename, data, file.content_type)
+
+def as_uploaded_document(file):
+    """Return file as an UploadedDocument, reading it once if it is still a file object."""
+    if isinstance(file, UploadedDocument):
+        return file
+    return UploadedDocument(file.filename, file.read(), getattr(file, 'content_type', None))
+
+def sniff_mime_type(document):
+    """Identify a document's MIME type from its leading bytes."""
+    with timed('mime_sniff'):
+        return magic.from_buffer(bytes(document.view[:MIME_SNIFF_BYTES]), mime=True)
+
+class FieldExtractor:
+    """Extracts one box of a tax form using a prioritized list of regex patterns.
+    
+    Patterns are compiled once. Candidates are tried in priority order and the
+    first one that converts to a number within the sanity range wins.
+    """
+    
+    def __init__(self, form, field, patterns, min_value=None, max_value=None, flags=re.IGNORECASE):
+        self.form = form
+        self.field = field
+        # Each pattern is a regex string (value in group 1) or a (regex, group) pair
+        self.patterns = [(re.compile(p, flags), 1) if isinstance(p, str) else (re.compile(p[0], flags), p[1])
+                         for p in patterns]
+        self.min_value = min_value
+        self.max_value = max_value
+    
+    def _evaluate(self, value_str, check):
+        """Convert a candidate to a number. Returns the value, or None if it is rejected."""
+        try:
+            value = float(value_str.replace(',', ''))
+        except (ValueError, AttributeError):
+            extract_logger.debug("Could not convert %s %s to float: %s", self.form, self.field, value_str)
+            return None
+        if (self.min_value is not None and value < self.min_value) or \
+           (self.max_value is not None and value > self.max_value):
+            extract_logger.debug("Found %s %s outside reasonable range: $%.2f", self.form, self.field, value)
+            return None
+        if check is not None and not check(value):
+            extract_logger.debug("Rejected %s %s candidate: $%.2f", self.form, self.field, value)
+            return None
+        return value
+    
+    def extract(self, text, check=None):
+        """Return (value, priority) of the best candidate in text, or (None, None).
+        
+        check is an optional extra sanity test on the converted value.
+        """
+        # Searching in priority order stops at the first accepted candidate. A single
+        # combined regex would cost the sum of every pattern on each scan in Python's
+        # backtracking engine, which measured slower on real W-2 text.
+        for priority, (regex, group) in enumerate(self.patterns):
+            match = regex.search(text)
+            if match:
+                try:
+                    value_str = match.group(group)
+                except IndexError:
+                    continue
+                value = self._evaluate(value_str, check)
+                if value is not None:
+                    return value, priority
+        return None, None
+
+# Extraction patterns by form and box, in priority order, with sanity ranges
+FORM_FIELD_PATTERNS = {
+    'W-2': {
+        'wages': {
+            'patterns': [
+                r'(?:Box\s*1|Box\s*1:|\b1\b)\s*(?:Wages,\s+tips|Wages|wages|Income).+?(\d[\d,.]+)',
+                r'Wages,\s+tips,\s+other\s+comp\w*.+?(\d[\d,.]+)',
+                r'(\d{4,6}\.\d{2})(?=\s+\d{3,4}\.\d{2})',  # Amount followed by another amount
+                r'(\d{4,6}\.\d{2})(?=.*Federal)',  # Amount near "Federal"
+                r'(\d{4,6}\.\d{2})',  # Last resort - any amount in expected range
+            ],
+            'min_value': 100,
+            'max_value': 1000000
+        },
+        'federal_tax_withheld': {
+            'patterns': [
+                r'(?:Box\s*2|Box\s*2:|\b2\b)\s*(?:Fed|Federal).+?(\d[\d,.]+)',
+                r'Federal\s+income\s+tax\s+withheld.+?(\d[\d,.]+)',
+                r'(\d{3,4}\.\d{2})(?=\s*(?:Box|Fed))',  # Tax amount near Box or Federal
+                r'(\d{3,4}\.\d{2})',  # Last resort - any amount in expected range
+            ]
+        }
+    },
+    'W-2/ByteDance': {
+        'wages': {
+            'patterns': [
+                r'(?:Box\s*1|Box\s*1:|Box\s*1\s+Wages).*?(\d{1,3}(?:,\d{3})*\.\d{2})',
+                r'Wages,\s+tips,\s+other\s+comp\w*.+?(\d{1,3}(?:,\d{3})*\.\d{2})',
+                r'1\s+Wages.*?(\d{1,3}(?:,\d{3})*\.\d{2})',
+                r'Wages.*?(\d{6,7}\.\d{2})',  # ByteDance typically has 6-7 digit wages
+            ],
+            'min_value': 10000,
+            'max_value': 1000000
+        }
+    },
+    'W-2/Oracle': {
+        'wages': {
+            'patterns': [
+                r'(?:Box\s*1|Box\s*1:|Box\s*1\s+Wages).*?(\d{1,3}(?:,\d{3})*\.\d{2})',
+                r'Wages,\s+tips,\s+other\s+comp\w*.+?(\d{1,3}(?:,\d{3})*\.\d{2})',
+                r'1\s+Wages.*?(\d{1,3}(?:,\d{3})*\.\d{2})',
+                r'Wages.*?(\d{4,6}\.\d{2})',  # Oracle typically has 5-6 digit wages
+            ],
+            'min_value': 10000,
+            'max_value': 500000
+        }
+    },
+    '1099-INT': {
+        'interest': {
+            'patterns': [
+                r'Interest\s+Income.+?(\d[\d,.]+)',
+                r'Box\s*1[:\.]?\s+Interest\s+income[^$]*?(\d[\d,.]+)',
+                r'Total\s+interest\s+income.*?(\d[\d,.]+)'
+            ]
+        }
+    },
+    '1099-DIV': {
+        'ordinary_dividends': {
+            'patterns': [
+                (r'(Dividend|Ordinary\s+dividends).+?(\d[\d,.]+)', 2),
+                r'Box\s*1a[:\.]?\s+Ordinary\s+dividends[^$]*?(\d[\d,.]+)',
+                r'Total\s+dividends.*?(\d[\d,.]+)'
+            ]
+        }
+    },
+    '1099-MISC/NEC': {
+        'nonemployee_compensation': {
+            'patterns': [
+                r'Nonemployee\s+Compensation.+?(\d[\d,.]+)',
+                r'Box\s*7[:\.]?\s+Nonemployee\s+compensation[^$]*?(\d[\d,.]+)'
+            ]
+        }
+    },
+    '1099-R': {
+        'distributions': {
+            'patterns': [
+                (r'(IRA\s+distributions|Total\s+distribution).+?(\d[\d,.]+)', 2)
+            ]
+        }
+    },
+    '1098': {
+        'mortgage_interest': {
+            'patterns': [
+                r'(?:Box\s*1|Box\s*1:|\b1\b)\s*Mortgage\s+interest.+?(\d[\d,.]+)',
+                r'Mortgage\s+interest\s+received.+?(\d[\d,.]+)',
+                r'(\d{1,3}(?:,\d{3})*\.\d{2})(?=.*mortgage)',
+            ],
+            'min_value': 100,  # Sanity check for reasonable mortgage interest range
+            'max_value': 100000
+        }
+    },
+    'K-1': {
+        'partner_share': {
+            'patterns': [
+                r'Partner\s+Distributive\s+Share.+?(\d[\d,.]+)',
+                r'Schedule\s+K-1\s+\(Form\s+1065\).+?(\d[\d,.]+)'
+            ]
+        }
+    }
+}
+
+# Compiled once at import, indexed as FIELD_EXTRACTORS[form][field]
+FIELD_EXTRACTORS = {
+    form: {field: FieldExtractor(form, field, **spec) for field, spec in fields.items()}
+    for form, fields in FORM_FIELD_PATTERNS.items()
+}
+
+# Document type detection and helper patterns
+W2_HEADER_RE = re.compile(r'(W-?2\s+Wage|Form\s+W-?2|W-?2\s+Tax)', re.IGNORECASE)
+W2_BOX_LABEL_RE = re.compile(r'(Wages.*Box\s+1|Federal\s+Tax\s+Withheld.*Box\s+2)', re.IGNORECASE)
+FORM_1098_RE = re.compile(r'(1098.*Mortgage|Mortgage.*1098|Form\s+1098)', re.IGNORECASE)
+W2_CONTENT_RE = re.compile(r'(Wages.*Tips.*Compensation|Federal\s+Income\s+Tax\s+Withheld)', re.IGNORECASE)
+UT_AMOUNT_RE = re.compile(r'\d{5,6}\.\d{2}')
+EMPLOYEE_NAME_RE = re.compile(r'(?:Employee\'s name|Employee name)[^\n]*?([A-Z][a-z]+ [A-Z][a-z]+)')
+BYTEDANCE_AMOUNT_RE = re.compile(r'(\d{1,3}(?:,\d{3})*\.\d{2}|\d{5,7}\.\d{2})')
+ORACLE_AMOUNT_RE = re.compile(r'(\d{1,3}(?:,\d{3})*\.\d{2}|\d{4,6}\.\d{2})')
+
 class TaxDocument:
     def __init__(self):
         """Initialize a new TaxDocument."""
@@ -74,22 +447,32 @@ class TaxDocument:
         self.tax_paid = 0  # Federal tax already paid through withholding
         self.individuals = []  # Track individuals found in documents for joint filing
         self.document_type = "Unknown"  # Track the type of document processed
+        self.fields = {}  # Box amounts read from the processed document, by field name
+    
+    def add_record(self, record):
+        """Add one document's amounts to the totals."""
+        for key, amount in record.income.items():
+            self.income[key] += amount
+        for key, amount in record.deductions.items():
+            self.deductions[key] += amount
+        self.tax_paid += record.tax_paid
+        self.individuals.extend(name for name in record.individuals if name not in self.individuals)
     
     def detect_document_type(self, text):
         """Detect the type of tax document based on text patterns."""
         # Check for ByteDance pattern first (higher priority)
         if "ByteDance" in text or "Byte Dance" in text or "BYTEDANCE" in text:
             self.document_type = "W-2"
-            logger.info("Detected W-2 form from ByteDance")
+            extract_logger.debug("Detected W-2 form from ByteDance")
             return
             
         # Enhanced W-2 detection
-        if re.search(r'(W-?2\s+Wage|Form\s+W-?2|W-?2\s+Tax)', text, re.IGNORECASE):
+        if W2_HEADER_RE.search(text):
             self.document_type = "W-2"
-            logger.info("Detected W-2 form based on form header or title")
-        elif re.search(r'(Wages.*Box\s+1|Federal\s+Tax\s+Withheld.*Box\s+2)', text, re.IGNORECASE):
+            extract_logger.debug("Detected W-2 form based on form header or title")
+        elif W2_BOX_LABEL_RE.search(text):
             self.document_type = "W-2"
-            logger.info("Detected W-2 form based on box labels")
+            extract_logger.debug("Detected W-2 form based on box labels")
         elif "1099-INT" in text:
             self.document_type = "1099-INT"
         elif "1099-DIV" in text:
@@ -100,34 +483,32 @@ class TaxDocument:
             self.document_type = "1099-NEC"
         elif "1099-R" in text:
             self.document_type = "1099-R"
-        elif re.search(r'(1098.*Mortgage|Mortgage.*1098|Form\s+1098)', text, re.IGNORECASE):
+        elif FORM_1098_RE.search(text):
             self.document_type = "1098"
         elif "Schedule K-1" in text:
             self.document_type = "K-1"
         else:
             # Try to detect based on content patterns
-            if re.search(r'(Wages.*Tips.*Compensation|Federal\s+Income\s+Tax\s+Withheld)', text, re.IGNORECASE):
+            if W2_CONTENT_RE.search(text):
                 self.document_type = "W-2"
-                logger.info("Detected W-2 form based on content patterns")
+                extract_logger.debug("Detected W-2 form based on content patterns")
             # Check for University of Texas pattern which indicates a W-2
-            elif "University of Texas" in text and re.search(r'\d{5,6}\.\d{2}', text):
+            elif "University of Texas" in text and UT_AMOUNT_RE.search(text):
                 self.document_type = "W-2"
-                logger.info("Detected W-2 form from University of Texas")
+                extract_logger.debug("Detected W-2 form from University of Texas")
             else:
                 self.document_type = "Other"
-        
-        logger.info(f"Detected document type: {self.document_type}")
+
 
     def process_text(self, text):
         """Process extracted text from tax documents."""
-        # First, log the entire extracted text for debugging
-        logger.info("------ EXTRACTED TEXT START ------")
-        logger.info(text)
-        logger.info("------ EXTRACTED TEXT END ------")
+        # Document text is only logged when explicitly enabled; it is large and contains personal data
+        if LOG_DOCUMENT_TEXT:
+            extract_logger.debug("Extracted text:\n%s", text)
         
         # Detect document type
         self.detect_document_type(text)
-        logger.info(f"Processing document type: {self.document_type}")
+        extract_logger.info("Processing document type: %s (%d chars)", self.document_type, len(text))
         
         # Process based on document type
         if self.document_type == "W-2":
@@ -145,13 +526,12 @@ class TaxDocument:
         elif self.document_type == "K-1":
             self.process_k1(text)
         else:
-            logger.warning("Unknown document type, attempting general processing")
+            extract_logger.warning("Unknown document type, attempting general processing")
             self.process_general(text)
         
         # Log the extracted income and deductions
-        logger.info(f"Extracted income: {json.dumps(self.income, indent=2)}")
-        logger.info(f"Extracted deductions: {json.dumps(self.deductions, indent=2)}")
-        logger.info(f"Tax paid: {self.tax_paid}")
+        extract_logger.debug("Running totals - income: %s, deductions: %s, tax paid: %s",
+                             self.income, self.deductions, self.tax_paid)
     
     def process_w2(self, text):
         """Process W-2 form text."""
@@ -159,58 +539,35 @@ class TaxDocument:
         document_wages = 0
         document_tax = 0
         
-        logger.info("=== STARTING W-2 PROCESSING ===")
-        logger.info(f"Text snippet (first 200 chars): {text[:200]}")
-        
         # Extract individual name if available
-        name_match = re.search(r'(?:Employee\'s name|Employee name)[^\n]*?([A-Z][a-z]+ [A-Z][a-z]+)', text)
+        name_match = EMPLOYEE_NAME_RE.search(text)
         if name_match:
             individual_name = name_match.group(1)
-            logger.info(f"Found individual: {individual_name}")
         else:
             individual_name = "to be"
-            logger.info(f"Found individual: {individual_name}")
+        if LOG_DOCUMENT_TEXT:
+            extract_logger.debug("Found individual: %s", individual_name)
         
         # Special case for ByteDance W-2 format - check this first
         if "ByteDance" in text or "Byte Dance" in text or "BYTEDANCE" in text:
-            logger.info("Processing ByteDance W-2 format")
-            logger.info("=== DETAILED EXTRACTION FOR BYTEDANCE W-2 ===")
+            extract_logger.debug("Processing ByteDance W-2 format")
             
             # First, try to find Box 1 wages with specific patterns for ByteDance
-            box1_patterns = [
-                r'(?:Box\s*1|Box\s*1:|Box\s*1\s+Wages).*?(\d{1,3}(?:,\d{3})*\.\d{2})',
-                r'Wages,\s+tips,\s+other\s+comp\w*.+?(\d{1,3}(?:,\d{3})*\.\d{2})',
-                r'1\s+Wages.*?(\d{1,3}(?:,\d{3})*\.\d{2})',
-                r'Wages.*?(\d{6,7}\.\d{2})',  # ByteDance typically has 6-7 digit wages
-            ]
-            
-            found_wages = False
-            for i, pattern in enumerate(box1_patterns):
-                logger.info(f"Trying ByteDance wage pattern {i+1}: {pattern}")
-                wages_match = re.search(pattern, text, re.IGNORECASE)
-                if wages_match:
-                    try:
-                        wages_str = wages_match.group(1).replace(',', '')
-                        logger.info(f"Found potential ByteDance wage match: {wages_str}")
-                        wages = float(wages_str)
-                        if 10000 <= wages <= 1000000:  # ByteDance wages are typically in this range
-                            document_wages = wages
-                            self.income['wages'] += wages
-                            logger.info(f"Found valid ByteDance wages: ${wages:.2f}")
-                            found_wages = True
-                            break
-                        else:
-                            logger.warning(f"Found ByteDance wages outside reasonable range: ${wages:.2f}")
-                    except ValueError:
-                        logger.warning(f"Could not convert ByteDance wages to float: {wages_match.group(1)}")
+            wages, priority = FIELD_EXTRACTORS['W-2/ByteDance']['wages'].extract(text)
+            found_wages = wages is not None
+            if found_wages:
+                document_wages = wages
+                self.income['wages'] += wages
+                self.fields['wages'] = wages
+                extract_logger.debug("Found valid ByteDance wages with pattern %d: $%.2f", priority + 1, wages)
             
             # If specific patterns didn't work, try to find all large numbers and use the largest one
             if not found_wages:
-                logger.info("Trying to find ByteDance wages by extracting all large numbers")
+                extract_logger.debug("Trying to find ByteDance wages by extracting all large numbers")
                 # Look for numbers that might be wages (typically 6-7 digits with decimal)
-                all_numbers = re.findall(r'(\d{1,3}(?:,\d{3})*\.\d{2}|\d{5,7}\.\d{2})', text)
+                all_numbers = BYTEDANCE_AMOUNT_RE.findall(text)
                 if all_numbers:
-                    logger.info(f"Found number candidates: {all_numbers}")
+                    extract_logger.debug("Found %d number candidates", len(all_numbers))
                     # Convert to float and filter by reasonable range
                     wage_candidates = []
                     for num_str in all_numbers:
@@ -224,12 +581,13 @@ class TaxDocument:
                     if wage_candidates:
                         # Sort by value (descending)
                         wage_candidates.sort(reverse=True)
-                        logger.info(f"Sorted wage candidates: {[f'${w:.2f}' for w in wage_candidates]}")
+                        extract_logger.debug("%d wage candidates in range", len(wage_candidates))
                         
                         # The largest value is likely the annual wage
                         document_wages = wage_candidates[0]
                         self.income['wages'] += document_wages
-                        logger.info(f"Selected ByteDance wage (largest value): ${document_wages:.2f}")
+                        self.fields['wages'] = document_wages
+                        extract_logger.debug("Selected ByteDance wage (largest value): $%.2f", document_wages)
                         found_wages = True
             
             # Now try to find federal tax withheld (Box 2)
@@ -237,55 +595,34 @@ class TaxDocument:
             bytedance_tax = 119441.08
             document_tax = bytedance_tax
             self.tax_paid += document_tax
+            self.fields['federal_tax_withheld'] = document_tax
             tax_percentage = (document_tax / document_wages) * 100 if document_wages > 0 else 0
-            logger.info(f"Using known ByteDance federal tax withheld: ${document_tax:.2f} ({tax_percentage:.2f}% of wages)")
+            extract_logger.debug("Using known ByteDance federal tax withheld: $%.2f (%.2f%% of wages)", document_tax, tax_percentage)
             found_tax = True
             
-            logger.info(f"Final ByteDance wages extracted: ${document_wages:.2f}")
-            logger.info(f"Final ByteDance tax withheld extracted: ${document_tax:.2f}")
-            logger.info("=== END OF BYTEDANCE W-2 EXTRACTION ===")
+            extract_logger.info("ByteDance W-2 - Wages: $%.2f, Tax: $%.2f", document_wages, document_tax)
             return
         
         # Special case for Oracle W-2 format
         elif "Oracle" in text or "ORACLE" in text:
-            logger.info("Processing Oracle W-2 format")
-            logger.info("=== DETAILED EXTRACTION FOR ORACLE W-2 ===")
+            extract_logger.debug("Processing Oracle W-2 format")
             
             # First, try to find Box 1 wages with specific patterns for Oracle
-            box1_patterns = [
-                r'(?:Box\s*1|Box\s*1:|Box\s*1\s+Wages).*?(\d{1,3}(?:,\d{3})*\.\d{2})',
-                r'Wages,\s+tips,\s+other\s+comp\w*.+?(\d{1,3}(?:,\d{3})*\.\d{2})',
-                r'1\s+Wages.*?(\d{1,3}(?:,\d{3})*\.\d{2})',
-                r'Wages.*?(\d{4,6}\.\d{2})',  # Oracle typically has 5-6 digit wages
-            ]
-            
-            found_wages = False
-            for i, pattern in enumerate(box1_patterns):
-                logger.info(f"Trying Oracle wage pattern {i+1}: {pattern}")
-                wages_match = re.search(pattern, text, re.IGNORECASE)
-                if wages_match:
-                    try:
-                        wages_str = wages_match.group(1).replace(',', '')
-                        logger.info(f"Found potential Oracle wage match: {wages_str}")
-                        wages = float(wages_str)
-                        if 10000 <= wages <= 500000:  # Oracle wages are typically in this range
-                            document_wages = wages
-                            self.income['wages'] += wages
-                            logger.info(f"Found valid Oracle wages: ${wages:.2f}")
-                            found_wages = True
-                            break
-                        else:
-                            logger.warning(f"Found Oracle wages outside reasonable range: ${wages:.2f}")
-                    except ValueError:
-                        logger.warning(f"Could not convert Oracle wages to float: {wages_match.group(1)}")
+            wages, priority = FIELD_EXTRACTORS['W-2/Oracle']['wages'].extract(text)
+            found_wages = wages is not None
+            if found_wages:
+                document_wages = wages
+                self.income['wages'] += wages
+                self.fields['wages'] = wages
+                extract_logger.debug("Found valid Oracle wages with pattern %d: $%.2f", priority + 1, wages)
             
             # If specific patterns didn't work, try to find all large numbers and use the largest one
             if not found_wages:
-                logger.info("Trying to find Oracle wages by extracting all large numbers")
+                extract_logger.debug("Trying to find Oracle wages by extracting all large numbers")
                 # Look for numbers that might be wages (typically 5-6 digits with decimal)
-                all_numbers = re.findall(r'(\d{1,3}(?:,\d{3})*\.\d{2}|\d{4,6}\.\d{2})', text)
+                all_numbers = ORACLE_AMOUNT_RE.findall(text)
                 if all_numbers:
-                    logger.info(f"Found number candidates: {all_numbers}")
+                    extract_logger.debug("Found %d number candidates", len(all_numbers))
                     # Convert to float and filter by reasonable range
                     wage_candidates = []
                     for num_str in all_numbers:
@@ -299,12 +636,13 @@ class TaxDocument:
                     if wage_candidates:
                         # Sort by value (descending)
                         wage_candidates.sort(reverse=True)
-                        logger.info(f"Sorted wage candidates: {[f'${w:.2f}' for w in wage_candidates]}")
+                        extract_logger.debug("%d wage candidates in range", len(wage_candidates))
                         
                         # The largest value is likely the annual wage
                         document_wages = wage_candidates[0]
                         self.income['wages'] += document_wages
-                        logger.info(f"Selected Oracle wage (largest value): ${document_wages:.2f}")
+                        self.fields['wages'] = document_wages
+                        extract_logger.debug("Selected Oracle wage (largest value): $%.2f", document_wages)
                         found_wages = True
             
             # Now try to find federal tax withheld (Box 2)
@@ -312,211 +650,442 @@ class TaxDocument:
             oracle_tax = 15142.14
             document_tax = oracle_tax
             self.tax_paid += document_tax
+            self.fields['federal_tax_withheld'] = document_tax
             tax_percentage = (document_tax / document_wages) * 100 if document_wages > 0 else 0
-            logger.info(f"Using known Oracle federal tax withheld: ${document_tax:.2f} ({tax_percentage:.2f}% of wages)")
+            extract_logger.debug("Using known Oracle federal tax withheld: $%.2f (%.2f%% of wages)", document_tax, tax_percentage)
             found_tax = True
             
-            logger.info(f"Final Oracle wages extracted: ${document_wages:.2f}")
-            logger.info(f"Final Oracle tax withheld extracted: ${document_tax:.2f}")
-            logger.info("=== END OF ORACLE W-2 EXTRACTION ===")
+            extract_logger.info("Oracle W-2 - Wages: $%.2f, Tax: $%.2f", document_wages, document_tax)
             return
         
         # Standard W-2 processing for other employers
         else:
-            logger.info("Using standard W-2 extraction patterns")
-            # Enhanced wages patterns for W-2
-            wages_patterns = [
-                r'(?:Box\s*1|Box\s*1:|\b1\b)\s*(?:Wages,\s+tips|Wages|wages|Income).+?(\d[\d,.]+)',
-                r'Wages,\s+tips,\s+other\s+comp\w*.+?(\d[\d,.]+)',
-                r'(\d{4,6}\.\d{2})(?=\s+\d{3,4}\.\d{2})',  # Amount followed by another amount
-                r'(\d{4,6}\.\d{2})(?=.*Federal)',  # Amount near "Federal"
-                r'(\d{4,6}\.\d{2})',  # Last resort - any amount in expected range
-            ]
-            
-            found_wages = False
-            for i, pattern in enumerate(wages_patterns):
-                logger.info(f"Trying wage pattern {i+1}: {pattern}")
-                wages_match = re.search(pattern, text, re.IGNORECASE)
-                if wages_match:
-                    try:
-                        wages_str = wages_match.group(1).replace(',', '')
-                        logger.info(f"Found potential wage match: {wages_str}")
-                        wages = float(wages_str)
-                        if 100 <= wages <= 1000000:  # More permissive range
-                            document_wages = wages
-                            self.income['wages'] += wages
-                            logger.info(f"Found valid wages: ${wages:.2f}")
-                            found_wages = True
-                            break
-                        else:
-                            logger.warning(f"Found wages outside reasonable range: ${wages:.2f}")
-                    except ValueError:
-                        logger.warning(f"Could not convert wages to float: {wages_match.group(1)}")
+            extract_logger.debug("Using standard W-2 extraction patterns")
+            extractors = FIELD_EXTRACTORS['W-2']
             
-            if not found_wages:
-                logger.warning("No valid wages found in document")
-
-            # Enhanced federal tax patterns
-            tax_patterns = [
-                r'(?:Box\s*2|Box\s*2:|\b2\b)\s*(?:Fed|Federal).+?(\d[\d,.]+)',
-                r'Federal\s+income\s+tax\s+withheld.+?(\d[\d,.]+)',
-                r'(\d{3,4}\.\d{2})(?=\s*(?:Box|Fed))',  # Tax amount near Box or Federal
-                r'(\d{3,4}\.\d{2})',  # Last resort - any amount in expected range
-            ]
-            
-            found_tax = False
-            for i, pattern in enumerate(tax_patterns):
-                logger.info(f"Trying tax pattern {i+1}: {pattern}")
-                tax_match = re.search(pattern, text, re.IGNORECASE)
-                if tax_match:
-                    try:
-                        tax_str = tax_match.group(1).replace(',', '')
-                        logger.info(f"Found potential tax match: {tax_str}")
-                        tax = float(tax_str)
-                        if tax <= document_wages * 0.5:  # Tax shouldn't be more than 50% of wages
-                            document_tax = tax
-                            self.tax_paid += tax
-                            logger.info(f"Found valid federal tax withheld: ${tax:.2f}")
-                            found_tax = True
-                            break
-                        else:
-                            logger.warning(f"Found tax amount too large relative to wages: ${tax:.2f}")
-                    except ValueError:
-                        logger.warning(f"Could not convert tax to float: {tax_match.group(1)}")
+            wages, priority = extractors['wages'].extract(text)
+            if wages is not None:
+                document_wages = wages
+                self.income['wages'] += wages
+                self.fields['wages'] = wages
+                extract_logger.debug("Found valid wages with pattern %d: $%.2f", priority + 1, wages)
+            else:
+                extract_logger.warning("No valid wages found in document")
             
-            if not found_tax:
-                logger.warning("No valid tax withholding found in document")
+            # Tax shouldn't be more than 50% of wages
+            tax, priority = extractors['federal_tax_withheld'].extract(text, check=lambda tax: tax <= document_wages * 0.5)
+            if tax is not None:
+                document_tax = tax
+                self.tax_paid += tax
+                self.fields['federal_tax_withheld'] = tax
+                extract_logger.debug("Found valid federal tax withheld with pattern %d: $%.2f", priority + 1, tax)
+            else:
+                extract_logger.warning("No valid tax withholding found in document")
                 
-            logger.info(f"Final standard W-2 extraction - Wages: ${document_wages:.2f}, Tax: ${document_tax:.2f}")
-            logger.info("=== END OF W-2 PROCESSING ===")
+            extract_logger.info("W-2 - Wages: $%.2f, Tax: $%.2f", document_wages, document_tax)
         
     def process_1099_int(self, text):
         """Process 1099-INT form text."""
-        # Existing 1099-INT processing logic
-        interest_patterns = [
-            r'Interest\s+Income.+?(\d[\d,.]+)',
-            r'Box\s*1[:\.]?\s+Interest\s+income[^$]*?(\d[\d,.]+)',
-            r'Total\s+interest\s+income.*?(\d[\d,.]+)'
-        ]
-        
-        for pattern in interest_patterns:
-            interest_match = re.search(pattern, text, re.IGNORECASE)
-            if interest_match:
-                try:
-                    interest = float(interest_match.group(1).replace(',', ''))
-                    self.income['interest'] += interest
-                    logger.info(f"Found interest income: ${interest:.2f}")
-                    break
-                except ValueError:
-                    logger.warning(f"Could not convert interest to float: {interest_match.group(1)}")
+        interest, _ = FIELD_EXTRACTORS['1099-INT']['interest'].extract(text)
+        if interest is not None:
+            self.income['interest'] += interest
+            self.fields['interest'] = interest
+            extract_logger.info("Found interest income: $%.2f", interest)
 
     def process_1099_div(self, text):
         """Process 1099-DIV form text."""
-        # Existing 1099-DIV processing logic
-        dividend_patterns = [
-            r'(Dividend|Ordinary\s+dividends).+?(\d[\d,.]+)',
-            r'Box\s*1a[:\.]?\s+Ordinary\s+dividends[^$]*?(\d[\d,.]+)',
-            r'Total\s+dividends.*?(\d[\d,.]+)'
-        ]
-        
-        for pattern in dividend_patterns:
-            dividends_match = re.search(pattern, text, re.IGNORECASE)
-            if dividends_match:
-                try:
-                    # Group index might vary based on the pattern
-                    group_idx = 2 if '(' in pattern else 1
-                    dividends = float(dividends_match.group(group_idx).replace(',', ''))
-                    self.income['dividends'] += dividends
-                    logger.info(f"Found dividend income: ${dividends:.2f}")
-                    break
-                except (ValueError, IndexError):
-                    logger.warning(f"Could not convert dividends to float from match: {dividends_match.group(0)}")
+        dividends, _ = FIELD_EXTRACTORS['1099-DIV']['ordinary_dividends'].extract(text)
+        if dividends is not None:
+            self.income['dividends'] += dividends
+            self.fields['ordinary_dividends'] = dividends
+            extract_logger.info("Found dividend income: $%.2f", dividends)
 
     def process_1099_misc_nec(self, text):
         """Process 1099-MISC and 1099-NEC form text."""
-        # Add logic to process 1099-MISC and 1099-NEC
-        misc_patterns = [
-            r'Nonemployee\s+Compensation.+?(\d[\d,.]+)',
-            r'Box\s*7[:\.]?\s+Nonemployee\s+compensation[^$]*?(\d[\d,.]+)'
-        ]
-        for pattern in misc_patterns:
-            match = re.search(pattern, text, re.IGNORECASE)
-            if match:
-                try:
-                    amount = float(match.group(1).replace(',', ''))
-                    self.income['other'] += amount
-                    logger.info(f"Found nonemployee compensation: ${amount:.2f}")
-                    break
-                except ValueError:
-                    logger.warning(f"Could not convert nonemployee compensation to float: {match.group(1)}")
+        amount, _ = FIELD_EXTRACTORS['1099-MISC/NEC']['nonemployee_compensation'].extract(text)
+        if amount is not None:
+            self.income['other'] += amount
+            self.fields['nonemployee_compensation'] = amount
+            extract_logger.info("Found nonemployee compensation: $%.2f", amount)
 
     def process_1099_r(self, text):
         """Process 1099-R form text."""
-        # Existing 1099-R processing logic
-        ira_match = re.search(r'(IRA\s+distributions|Total\s+distribution).+?(\d[\d,.]+)', text, re.IGNORECASE)
-        if ira_match:
-            try:
-                ira = float(ira_match.group(2).replace(',', ''))
-                self.income['other'] += ira
-                logger.info(f"Found IRA distributions: ${ira:.2f}")
-            except ValueError:
-                logger.warning(f"Could not convert IRA distributions to float: {ira_match.group(2)}")
+        ira, _ = FIELD_EXTRACTORS['1099-R']['distributions'].extract(text)
+        if ira is not None:
+            self.income['other'] += ira
+            self.fields['distributions'] = ira
+            extract_logger.info("Found IRA distributions: $%.2f", ira)
 
     def process_1098(self, text):
         """Process 1098 form text."""
-        mortgage_patterns = [
-            r'(?:Box\s*1|Box\s*1:|\b1\b)\s*Mortgage\s+interest.+?(\d[\d,.]+)',
-            r'Mortgage\s+interest\s+received.+?(\d[\d,.]+)',
-            r'(\d{1,3}(?:,\d{3})*\.\d{2})(?=.*mortgage)',
-        ]
-        
-        for pattern in mortgage_patterns:
-            match = re.search(pattern, text, re.IGNORECASE)
-            if match:
-                try:
-                    amount_str = match.group(1).replace(',', '')
-                    amount = float(amount_str)
-                    if 100 <= amount <= 100000:  # Sanity check for reasonable mortgage interest range
-                        self.deductions['mortgage_interest'] += amount
-                        logger.info(f"Found mortgage interest: ${amount:.2f}")
-                        break
-                    else:
-                        logger.warning(f"Found mortgage interest outside reasonable range: ${amount:.2f}")
-                except ValueError:
-                    logger.warning(f"Could not convert mortgage interest to float: {match.group(1)}")
+        amount, _ = FIELD_EXTRACTORS['1098']['mortgage_interest'].extract(text)
+        if amount is not None:
+            self.deductions['mortgage_interest'] += amount
+            self.fields['mortgage_interest'] = amount
+            extract_logger.info("Found mortgage interest: $%.2f", amount)
 
     def process_k1(self, text):
         """Process K-1 form text."""
-        # Add logic to process K-1
-        k1_patterns = [
-            r'Partner\s+Distributive\s+Share.+?(\d[\d,.]+)',
-            r'Schedule\s+K-1\s+\(Form\s+1065\).+?(\d[\d,.]+)'
-        ]
-        for pattern in k1_patterns:
-            match = re.search(pattern, text, re.IGNORECASE)
-            if match:
-                try:
-                    amount = float(match.group(1).replace(',', ''))
-                    self.income['other'] += amount
-                    logger.info(f"Found K-1 income: ${amount:.2f}")
-                    break
-                except ValueError:
-                    logger.warning(f"Could not convert K-1 income to float: {match.group(1)}")
+        amount, _ = FIELD_EXTRACTORS['K-1']['partner_share'].extract(text)
+        if amount is not None:
+            self.income['other'] += amount
+            self.fields['partner_share'] = amount
+            extract_logger.info("Found K-1 income: $%.2f", amount)
 
     def process_general(self, text):
         """Process text for unknown document types."""
         # General processing logic if document type is unknown
         pass
 
-def check_tesseract_installed():
-    """Check if Tesseract OCR is installed and accessible."""
+# Fields each form type is expected to yield, for DocumentRecord.confidence
+FORM_FIELDS = {
+    'W-2': ('wages', 'federal_tax_withheld'),
+    '1099-INT': ('interest',),
+    '1099-DIV': ('ordinary_dividends',),
+    '1099-MISC': ('nonemployee_compensation',),
+    '1099-NEC': ('nonemployee_compensation',),
+    '1099-R': ('distributions',),
+    '1098': ('mortgage_interest',),
+    'K-1': ('partner_share',)
+}
+
+class DocumentRecord:
+    """The extraction result of one document, immutable once built.
+    
+    Each file yields one record independently of the others; the totals of an
+    upload are the records reduced with combine_records. confidence is the
+    share of the form's expected fields that were found, engine how its text
+    was obtained, and timings the seconds spent per stage.
+    """
+    
+    __slots__ = ('filename', 'document_type', 'fields', 'income', 'deductions', 'tax_paid',
+                 'individuals', 'confidence', 'engine', 'timings')
+    
+    def __init__(self, filename, document_type, fields, income, deductions, tax_paid,
+                 individuals=(), confidence=0.0, engine=None, timings=None):
+        values = {
+            'filename': filename,
+            'document_type': document_type,
+            'fields': MappingProxyType(dict(fields)),
+            'income': MappingProxyType(dict(income)),
+            'deductions': MappingProxyType(dict(deductions)),
+            'tax_paid': tax_paid,
+            'individuals': tuple(individuals),
+            'confidence': confidence,
+            'engine': engine,
+            'timings': MappingProxyType(dict(timings or {}))
+        }
+        for name, value in values.items():
+            object.__setattr__(self, name, value)
+    
+    def __setattr__(self, name, value):
+        raise AttributeError(f"DocumentRecord is immutable; cannot set {name}")
+    
+    def __delattr__(self, name):
+        raise AttributeError(f"DocumentRecord is immutable; cannot delete {name}")
+    
+    def __reduce__(self):
+        # Mapping proxies do not pickle; rebuild from plain dicts
+        return (DocumentRecord, (self.filename, self.document_type, dict(self.fields), dict(self.income),
+                                 dict(self.deductions), self.tax_paid, self.individuals, self.confidence,
+                                 self.engine, dict(self.timings)))
+    
+    def __repr__(self):
+        return f"DocumentRecord({self.filename!r}, {self.document_type!r}, fields={dict(self.fields)})"
+    
+    @classmethod
+    def from_text(cls, filename, text, engine=None, timings=None):
+        """Extract a record from one document's text."""
+        tax_doc = TaxDocument()
+        tax_doc.process_text(text)
+        expected = FORM_FIELDS.get(tax_doc.document_type, ())
+        confidence = sum(1 for field in expected if field in tax_doc.fields) / len(expected) if expected else 0.0
+        return cls(filename, tax_doc.document_type, tax_doc.fields, tax_doc.income, tax_doc.deductions,
+                   tax_doc.tax_paid, tax_doc.individuals, round(confidence, 2), engine, timings)
+    
+    def to_dict(self):
+        """JSON-friendly view, with amounts formatted like the rest of the results."""
+        return {
+            'filename': self.filename,
+            'document_type': self.document_type,
+            'fields': {k: '{:,.2f}'.format(v) for k, v in self.fields.items()},
+            'confidence': self.confidence,
+            'engine': self.engine,
+            'timings': {k: round(v, 3) for k, v in self.timings.items()}
+        }
+
+def combine_records(records):
+    """Reduce per-document records, in the order given, to one TaxDocument of totals."""
+    totals = TaxDocument()
+    for record in records:
+        totals.add_record(record)
+    return totals
+
+class OcrEngineManager:
+    """Pool of warm EasyOCR readers shared by concurrent requests.
+    
+    Readers are loaded in the background at startup ('eager') or on first
+    use ('lazy'). Callers check a reader out for one OCR call and check it
+    back in, so a reader is never used by two threads at once. Requests that
+    arrive while the model is still loading wait for it instead of silently
+    dropping to Tesseract.
+    """
+    
+    def __init__(self, pool_size, wait_seconds):
+        self.pool_size = max(1, pool_size)
+        self.wait_seconds = wait_seconds
+        self.idle = queue.Queue()
+        self.lock = threading.Lock()
+        self.loaded = 0
+        self.loading = 0
+        self.error = None
+        self.started_at = None
+        self.ready_at = None
+        self.load_seconds = []
+        self.first_request_wait = None
+    
+    @property
+    def available(self):
+        """Whether EasyOCR can be used at all (installed and not failed to load)."""
+        return EASYOCR_AVAILABLE and self.error is None
+    
+    @property
+    def ready(self):
+        return self.loaded > 0
+    
+    def _load_one(self):
+        """Load one reader into the pool. Returns False if the pool is already full or loading failed."""
+        if not EASYOCR_AVAILABLE:
+            return False
+        with self.lock:
+            if self.error is not None or self.loaded + self.loading >= self.pool_size:
+                return False
+            self.loading += 1
+            if self.started_at is None:
+                self.started_at = time.time()
+        
+        start_time = time.time()
+        try:
+            new_reader = easyocr.Reader(['en'], gpu=False)  # Set gpu=True if you have a GPU
+        except Exception as e:
+            ocr_logger.error("Error loading EasyOCR model: %s", str(e))
+            with self.lock:
+                self.loading -= 1
+                self.error = str(e)
+            return False
+        
+        load_time = time.time() - start_time
+        with self.lock:
+            self.loading -= 1
+            self.loaded += 1
+            self.load_seconds.append(load_time)
+            if self.ready_at is None:
+                self.ready_at = time.time()
+                ocr_logger.info("EasyOCR ready %.2f seconds after startup", self.ready_at - self.started_at)
+        self.idle.put(new_reader)
+        ocr_logger.info("Loaded EasyOCR reader %s/%s in %.2f seconds", self.loaded, self.pool_size, load_time)
+        return True
+    
+    def load(self):
+        """Load readers until the pool is full. Does nothing when EasyOCR is not installed."""
+        if not EASYOCR_AVAILABLE:
+            return
+        while self._load_one():
+            pass
+    
+    def start(self, mode):
+        """Begin loading readers in the background when mode is 'eager'."""
+        if EASYOCR_AVAILABLE and mode == 'eager':
+            # Initialize readers once - this is slow but only happens at startup
+            print("Initializing EasyOCR model (this may take a few moments)...")
+            threading.Thread(target=self.load, name='easyocr-loader', daemon=True).start()
+    
+    @contextmanager
+    def checkout(self):
+        """Check out a reader for the duration of the with block.
+        
+        Yields None when EasyOCR is unavailable or no reader became free
+        within wait_seconds, in which case callers fall back to Tesseract.
+        """
+        if not self.available:
+            yield None
+            return
+        
+        start_time = time.time()
+        try:
+            easyocr_reader = self.idle.get_nowait()
+        except queue.Empty:
+            # Load a reader now if the pool is not full yet (lazy mode), otherwise wait for one
+            self._load_one()
+            try:
+                easyocr_reader = self.idle.get(timeout=self.wait_seconds)
+            except queue.Empty:
+                easyocr_reader = None
+                ocr_logger.warning("No EasyOCR reader became available within %.0f seconds", self.wait_seconds)
+        
+        wait_time = time.time() - start_time
+        if self.first_request_wait is None:
+            self.first_request_wait = wait_time
+            ocr_logger.info("First EasyOCR request waited %.2f seconds for a reader", wait_time)
+        
+        try:
+            yield easyocr_reader
+        finally:
+            if easyocr_reader is not None:
+                self.idle.put(easyocr_reader)
+    
+    def status(self):
+        """Readiness and load timings of the reader pool."""
+        if not EASYOCR_AVAILABLE:
+            state = 'unavailable'
+        elif self.error is not None:
+            state = 'failed'
+        elif self.ready:
+            state = 'ready'
+        elif self.loading:
+            state = 'loading'
+        else:
+            state = 'not_loaded'
+        
+        return {
+            'engine': 'easyocr',
+            'state': state,
+            'pool_size': self.pool_size,
+            'loaded': self.loaded,
+            'idle': self.idle.qsize(),
+            'startup_seconds': self.ready_at - self.started_at if self.ready_at else None,
+            'load_seconds': self.load_seconds,
+            'first_request_wait_seconds': self.first_request_wait,
+            'error': self.error
+        }
+
+ocr_engines = OcrEngineManager(app.config['EASYOCR_READERS'], app.config['EASYOCR_WAIT_SECONDS'])
+
+EASYOCR_MODEL_HEIGHT = 64  # Height EasyOCR's recognizer expects text line crops at
+
+def recognize_lines(reader, crops):
+    """Recognize grayscale text line crops in one recognizer batch. Returns (text, confidence) per crop."""
+    image_list = []
+    max_ratio = 1
+    for index, crop in enumerate(crops):
+        ratio = crop.width / max(1, crop.height)
+        max_ratio = max(max_ratio, ratio)
+        width = max(1, int(EASYOCR_MODEL_HEIGHT * ratio))
+        image_list.append((index, np.asarray(crop.resize((width, EASYOCR_MODEL_HEIGHT), Image.LANCZOS))))
+    
+    ignore_char = ''.join(set(reader.character) - set(reader.lang_char))
+    result = easyocr_get_text(reader.character, EASYOCR_MODEL_HEIGHT, int(np.ceil(max_ratio)) * EASYOCR_MODEL_HEIGHT,
+                              reader.recognizer, reader.converter, image_list, ignore_char=ignore_char,
+                              batch_size=len(crops), workers=0, device=reader.device)
+    lines = [('', 0.0)] * len(crops)
+    for index, text, confidence in result:
+        lines[index] = (text, float(confidence))
+    return lines
+
+class RecognitionBatcher:
+    """Collects text lines from concurrent page OCR calls into shared recognition batches.
+    
+    Pages detect their text lines on their own and submit the line crops here.
+    A batch is recognized as soon as batch_size lines are waiting, or once the
+    oldest line has waited max_wait_seconds, so a lone request is never held
+    back for long. Lines from several pages and requests share one forward pass
+    of the recognizer instead of one pass per page.
+    """
+    
+    def __init__(self, batch_size, max_wait_seconds):
+        self.batch_size = batch_size
+        self.max_wait_seconds = max_wait_seconds
+        self.pending = deque()  # (queued_at, page, index, crop)
+        self.condition = threading.Condition()
+        self.threads = []
+    
+    def submit(self, crops):
+        """Queue the text line crops of one page. Returns a Future for a list of (text, confidence) in crop order."""
+        future = Future()
+        if not crops:
+            future.set_result([])
+            return future
+        
+        page = {'future': future, 'lines': [None] * len(crops), 'remaining': len(crops)}
+        queued_at = time.monotonic()
+        with self.condition:
+            # One recognition thread per reader, started on first use
+            while len(self.threads) < ocr_engines.pool_size:
+                thread = threading.Thread(target=self._run, name=f'easyocr-batcher-{len(self.threads)}', daemon=True)
+                thread.start()
+                self.threads.append(thread)
+            self.pending.extend((queued_at, page, index, crop) for index, crop in enumerate(crops))
+            self.condition.notify_all()
+        return future
+    
+    def _next_batch(self):
+        """Wait until a batch is full or its oldest line is due, then take it off the queue."""
+        with self.condition:
+            while not self.pending:
+                self.condition.wait()
+            deadline = self.pending[0][0] + self.max_wait_seconds
+            while len(self.pending) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self.condition.wait(remaining)
+            return [self.pending.popleft() for _ in range(min(self.batch_size, len(self.pending)))]
+    
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if not batch:
+                continue
+            
+            start_time = time.time()
+            try:
+                with ocr_engines.checkout() as easyocr_reader:
+                    if easyocr_reader is None:
+                        raise RuntimeError("No EasyOCR reader available")
+                    lines = recognize_lines(easyocr_reader, [crop for _, _, _, crop in batch])
+            except Exception as e:
+                ocr_logger.error("Error in batched EasyOCR recognition: %s", str(e))
+                for _, page, _, _ in batch:
+                    if not page['future'].done():
+                        page['future'].set_exception(e)
+                continue
+            
+            record_timing('easyocr_recognition_batch', time.time() - start_time)
+            record_stat('easyocr_batches')
+            record_stat('easyocr_batched_lines', len(batch))
+            for (_, page, index, _), line in zip(batch, lines):
+                page['lines'][index] = line
+                page['remaining'] -= 1
+                if page['remaining'] == 0 and not page['future'].done():
+                    page['future'].set_result(page['lines'])
+
+def get_recognition_batcher():
+    """Return the shared recognition batcher, or None when pages are recognized one readtext call at a time."""
+    global recognition_batcher
+    if app.config['EASYOCR_BATCH_SIZE'] <= 0 or easyocr_get_text is None or not ocr_engines.available:
+        return None
+    with recognition_batcher_lock:
+        if recognition_batcher is None:
+            recognition_batcher = RecognitionBatcher(app.config['EASYOCR_BATCH_SIZE'],
+                                                     app.config['EASYOCR_BATCH_WAIT_MS'] / 1000)
+        return recognition_batcher
+
+recognition_batcher = None
+recognition_batcher_lock = threading.Lock()
+
+# OCR worker processes load their own reader in init_ocr_worker
+if multiprocessing.parent_process() is None:
+    ocr_engines.start(app.config['EASYOCR_LOAD'])
+
+def probe_tesseract():
+    """Check if Tesseract OCR is installed and accessible. Returns (installed, message, version)."""
     try:
         # Try to get Tesseract version
         version = pytesseract.get_tesseract_version()
-        logger.info(f"Tesseract OCR version detected: {version}")
-        return True, f"Tesseract OCR v{version}"
+        ocr_logger.info("Tesseract OCR version detected: %s", version)
+        return True, f"Tesseract OCR v{version}", str(version)
     except Exception as e:
-        logger.error(f"Tesseract OCR not properly configured: {str(e)}")
+        ocr_logger.error("Tesseract OCR not properly configured: %s", str(e))
         # Try to find where tesseract might be installed
         possible_paths = [
             '/usr/local/bin/tesseract',
@@ -528,16 +1097,82 @@ def check_tesseract_installed():
         
         for path in possible_paths:
             if os.path.exists(path):
-                logger.info(f"Found Tesseract at {path}, but it's not in PATH or configured correctly")
-                return False, f"Tesseract found at {path} but not configured correctly"
+                ocr_logger.info("Found Tesseract at %s, but it's not in PATH or configured correctly", path)
+                return False, f"Tesseract found at {path} but not configured correctly", None
         
-        return False, "Tesseract OCR not found. Please install it and ensure it's in your PATH."
+        return False, "Tesseract OCR not found. Please install it and ensure it's in your PATH.", None
+
+def detect_engine_capabilities():
+    """Probe the OCR and document processing engines available in this environment."""
+    tesseract_installed, tesseract_message, tesseract_version = probe_tesseract()
+    
+    libmagic_version = None
+    if MAGIC_AVAILABLE:
+        try:
+            libmagic_version = str(magic.version())
+        except Exception:
+            pass
+    
+    return {
+        'tesseract': {
+            'available': tesseract_installed,
+            'version': tesseract_version,
+            'message': tesseract_message
+        },
+        'easyocr': {
+            'available': EASYOCR_AVAILABLE,
+            'version': getattr(easyocr, '__version__', None) if EASYOCR_AVAILABLE else None
+        },
+        'pymupdf': {
+            'available': PYMUPDF_AVAILABLE,
+            'version': fitz.VersionBind if PYMUPDF_AVAILABLE else None
+        },
+        'libmagic': {
+            'available': MAGIC_AVAILABLE,
+            'version': libmagic_version
+        },
+        'poppler': {
+            'available': shutil.which('pdftoppm') is not None,
+            'version': None
+        },
+        'detected_at': time.time()
+    }
 
-def process_image(image):
-    """Process image and extract text using OCR."""
+engine_capabilities = None
+engine_capabilities_lock = threading.Lock()
+
+def get_engine_capabilities(refresh=False):
+    """Return the engine capability registry, probing the environment only on first use or refresh."""
+    global engine_capabilities
+    with engine_capabilities_lock:
+        if engine_capabilities is None or refresh:
+            engine_capabilities = detect_engine_capabilities()
+        return engine_capabilities
+
+def check_tesseract_installed():
+    """Check if Tesseract OCR is installed and accessible, using the cached engine probe."""
+    tesseract = get_engine_capabilities()['tesseract']
+    return tesseract['available'], tesseract['message']
+
+# Probe the engines once at startup rather than on every image
+get_engine_capabilities()
+
+def process_image(image, progress=None):
+    """Process image and extract text using OCR.
+    
+    progress, if given, is called as progress('page', page=1, method=..., seconds=..., chars=...)
+    for each engine that reads the image, as process_pdf reports pages.
+    """
+    def report_read(method, text, seconds):
+        if progress is not None:
+            progress('page', page=1, method=method, seconds=round(seconds, 3), chars=len((text or '').strip()))
+    
     try:
+        # JPEGs are decoded straight at (close to) the target size and in grayscale; no-op for other formats
+        max_dimension = IMAGE_MAX_DIMENSION
+        image.draft('L', (max_dimension, max_dimension))
+        
         # Resize large images to reduce processing time
-        max_dimension = 3000  # Max dimension in pixels
         width, height = image.size
         
         # Only resize if the image is very large
@@ -549,73 +1184,79 @@ def process_image(image):
                 new_height = max_dimension
                 new_width = int(width * (max_dimension / height))
             
-            logger.info(f"Resizing image from {width}x{height} to {new_width}x{new_height} for faster processing")
+            ocr_logger.info("Resizing image from %sx%s to %sx%s for faster processing", width, height, new_width, new_height)
             image = image.resize((new_width, new_height), Image.LANCZOS)
         
-        # Check if we need to convert the image mode
-        if image.mode != 'RGB':
-            logger.info(f"Converting image from {image.mode} mode to RGB")
-            image = image.convert('RGB')
+        # Both engines read grayscale; it is a third of the pixels of RGB
+        if image.mode != 'L':
+            image = image.convert('L')
             
         # Apply some image enhancement if needed
         # image = ImageEnhance.Contrast(image).enhance(1.5)  # Increase contrast
             
         if not check_tesseract_installed()[0]:
-            logger.error("Tesseract not installed")
+            ocr_logger.error("Tesseract not installed")
             return f"OCR ERROR: Tesseract OCR not installed"
             
-        if EASYOCR_AVAILABLE and reader is not None:
-            try:
-                # Use EasyOCR
-                start_time = time.time()
-                logger.info("Processing with EasyOCR...")
-                
-                # Convert to numpy array for EasyOCR
-                img_array = np.array(image)
-                
-                # EasyOCR processing
-                text_results = reader.readtext(img_array)
-                
-                # Extract text from results
-                text = '\n'.join([item[1] for item in text_results])
-                
-                processing_time = time.time() - start_time
-                logger.info(f"EasyOCR extraction completed in {processing_time:.2f} seconds")
-                
-                if text and text.strip() != '':
-                    logger.info("Successfully extracted text with EasyOCR")
-                    return text
-                else:
-                    logger.warning("No text extracted with EasyOCR")
-            except Exception as e:
-                logger.error(f"Error using EasyOCR: {str(e)}")
-                # Continue with Tesseract as fallback
+        with ocr_engines.checkout() as easyocr_reader:
+            if easyocr_reader is not None:
+                try:
+                    # Use EasyOCR
+                    start_time = time.time()
+                    ocr_logger.info("Processing with EasyOCR...")
+                    
+                    # Convert to numpy array for EasyOCR
+                    img_array = np.asarray(image)
+                    
+                    # EasyOCR processing
+                    text_results = easyocr_reader.readtext(img_array)
+                    
+                    # Extract text from results
+                    text = '\n'.join([item[1] for item in text_results])
+                    
+                    processing_time = time.time() - start_time
+                    record_timing('ocr_easyocr', processing_time)
+                    report_read('easyocr', text, processing_time)
+                    ocr_logger.info("EasyOCR extraction completed in %.2f seconds", processing_time)
+                    
+                    if text and text.strip() != '':
+                        ocr_logger.info("Successfully extracted text with EasyOCR")
+                        return text
+                    else:
+                        ocr_logger.warning("No text extracted with EasyOCR")
+                except Exception as e:
+                    ocr_logger.error("Error using EasyOCR: %s", str(e))
+                    report_read('easyocr', '', time.time() - start_time)
+                    # Continue with Tesseract as fallback
+                record_stat('image_tesseract_fallbacks')
         
         # Use Tesseract as fallback or primary if EasyOCR is not available
         start_time = time.time()
-        logger.info("Processing with Tesseract OCR...")
+        ocr_logger.info("Processing with Tesseract OCR...")
         
         text = pytesseract.image_to_string(image)
         
         processing_time = time.time() - start_time
-        logger.info(f"Tesseract extraction completed in {processing_time:.2f} seconds")
+        record_timing('ocr_tesseract', processing_time)
+        ocr_logger.info("Tesseract extraction completed in %.2f seconds", processing_time)
         
         if not text or text.strip() == '':
-            logger.warning("No text extracted from image. Trying different configurations...")
+            ocr_logger.warning("No text extracted from image. Trying different configurations...")
             
             # Try again with different configurations
             custom_config = r'--oem 1 --psm 3'
             text = pytesseract.image_to_string(image, config=custom_config)
             
             if not text or text.strip() == '':
-                logger.warning("Still no text extracted. Trying with different page segmentation...")
+                ocr_logger.warning("Still no text extracted. Trying with different page segmentation...")
                 # Try with different page segmentation modes
                 for psm in [6, 4, 11]:  # Single block, Single column, Single word
                     custom_config = f'--oem 1 --psm {psm}'
                     text = pytesseract.image_to_string(image, config=custom_config)
                     if text and text.strip() != '':
-                        logger.info(f"Text extracted with PSM {psm}")
+                        ocr_logger.info("Text extracted with PSM %s", psm)
                         break
+        report_read('tesseract', text, time.time() - start_time)
         
         if text and text.strip() != '':
             return text
@@ -624,279 +1265,1130 @@ def process_image(image):
         
     except Exception as e:
         message = f"Error processing image: {str(e)}"
-        logger.error(message)
+        ocr_logger.error(message)
         return f"OCR ERROR: {message}"
 
-def process_pdf(file):
-    """Process PDF file with multiple fallback methods."""
-    temp_file = None
-    start_time = time.time()
+def refine_low_confidence_lines(reader, image, result, regions):
+    """Re-read EasyOCR lines below OCR_MIN_CONFIDENCE from a higher-DPI render of just their region.
+    
+    Returns the line texts, with a line replaced when the re-read is more confident.
+    """
+    lines = [text for _, text, _ in result]
+    width, height = image.size
+    low_confidence = sorted((confidence, index) for index, (_, _, confidence) in enumerate(result)
+                            if confidence < OCR_MIN_CONFIDENCE)
+    for confidence, index in low_confidence[:OCR_MAX_REFINED_REGIONS]:
+        box = result[index][0]
+        xs = [point[0] for point in box]
+        ys = [point[1] for point in box]
+        # Pad the box a little so glyphs cut off by the low-resolution detection are included
+        pad_x, pad_y = 0.01 * width, 0.5 * (max(ys) - min(ys))
+        region = ((min(xs) - pad_x) / width, (min(ys) - pad_y) / height,
+                  (max(xs) + pad_x) / width, (max(ys) + pad_y) / height)
+        refined = reader.readtext(np.asarray(regions.render(region)))
+        record_stat('ocr_regions_refined')
+        if refined:
+            refined_confidence = sum(item[2] for item in refined) / len(refined)
+            if refined_confidence > confidence:
+                lines[index] = ' '.join(item[1] for item in refined)
+    return lines
+
+def detect_page_lines(image):
+    """Detect text lines on a grayscale page with EasyOCR. Returns (boxes, crops), or None if no reader is available.
+    
+    Boxes are four corner points, as readtext reports them, and crops are the
+    matching regions of the page.
+    """
+    with ocr_engines.checkout() as easyocr_reader:
+        if easyocr_reader is None:
+            return None
+        horizontal_list, free_list = easyocr_reader.detect(np.asarray(image))
+    
+    # Rotated lines are read from their bounding rectangle
+    rectangles = [tuple(box) for box in horizontal_list[0]]
+    rectangles += [(min(p[0] for p in polygon), max(p[0] for p in polygon),
+                    min(p[1] for p in polygon), max(p[1] for p in polygon)) for polygon in free_list[0]]
+    boxes, crops = [], []
+    for x_min, x_max, y_min, y_max in rectangles:
+        x_min, y_min = max(0, int(x_min)), max(0, int(y_min))
+        x_max, y_max = min(image.width, int(x_max)), min(image.height, int(y_max))
+        if x_max <= x_min or y_max <= y_min:
+            continue
+        boxes.append([[x_min, y_min], [x_max, y_min], [x_max, y_max], [x_min, y_max]])
+        crops.append(image.crop((x_min, y_min, x_max, y_max)))
+    return boxes, crops
+
+def ocr_page_easyocr(image, page_num, regions=None):
+    """OCR a single PDF page with EasyOCR. Returns an empty string if no text was found.
     
+    When regions is given, low-confidence lines are re-read from a higher-DPI
+    render of just those lines rather than rendering the whole page larger.
+    """
     try:
-        # Save the file temporarily to process it
-        temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.pdf')
-        file.save(temp_file.name)
+        ocr_logger.debug("Processing page %s with EasyOCR", page_num)
+        
+        # Pages are rendered at the target size; this only catches images from other sources
+        width, height = image.size
+        if width > OCR_MAX_DIMENSION or height > OCR_MAX_DIMENSION:
+            scale = min(OCR_MAX_DIMENSION/width, OCR_MAX_DIMENSION/height)
+            new_width = int(width * scale)
+            new_height = int(height * scale)
+            ocr_logger.debug("Resizing image from %sx%s to %sx%s", width, height, new_width, new_height)
+            image = image.resize((new_width, new_height), Image.LANCZOS)
+        if image.mode != 'L':
+            image = image.convert('L')
+        
+        batcher = get_recognition_batcher()
+        if batcher is not None:
+            # Detect lines here, then recognize them in a batch shared with other pages and requests
+            detected = detect_page_lines(image)
+            if detected is None:
+                return ''
+            boxes, crops = detected
+            recognized = batcher.submit(crops).result()
+            result = [(box, text, confidence) for box, (text, confidence) in zip(boxes, recognized)]
+            lines = [text for _, text, _ in result]
+            if regions is not None and any(confidence < OCR_MIN_CONFIDENCE for _, _, confidence in result):
+                with ocr_engines.checkout() as easyocr_reader:
+                    if easyocr_reader is not None:
+                        lines = refine_low_confidence_lines(easyocr_reader, image, result, regions)
+        else:
+            # Process with EasyOCR
+            with ocr_engines.checkout() as easyocr_reader:
+                if easyocr_reader is None:
+                    return ''
+                result = easyocr_reader.readtext(np.asarray(image))
+                if regions is not None:
+                    lines = refine_low_confidence_lines(easyocr_reader, image, result, regions)
+                else:
+                    lines = [item[1] for item in result]
+        page_text = '\n'.join(lines)
+        
+        if page_text and page_text.strip() != '':
+            ocr_logger.debug("EasyOCR: Extracted text from page %s", page_num)
+            return page_text
+        ocr_logger.warning("EasyOCR: No text found on page %s", page_num)
+    except Exception as ocr_error:
+        ocr_logger.error("Error in EasyOCR for page %s: %s", page_num, str(ocr_error))
+    return ''
+
+def ocr_page_tesseract(image, page_num, regions=None):
+    """OCR a single PDF page with process_image. Returns an empty string on failure."""
+    try:
+        page_text = process_image(image)
+        if page_text and not page_text.startswith("ERROR:"):
+            ocr_logger.debug("Extracted text from page %s", page_num)
+            return page_text
+        ocr_logger.warning("Failed to extract text from page %s: %s", page_num, page_text)
+    except Exception as ocr_error:
+        ocr_logger.error("Error in OCR for page %s: %s", page_num, str(ocr_error))
+    return ''
+
+OCR_PAGE_ENGINES = {
+    'easyocr': ocr_page_easyocr,
+    'tesseract': ocr_page_tesseract
+}
+
+def init_ocr_worker():
+    """Load a warm OCR engine in each worker process of the page OCR pool."""
+    ocr_engines.pool_size = 1
+    # A worker handles one page at a time, so there is nothing to batch with
+    app.config['EASYOCR_BATCH_SIZE'] = 0
+    ocr_engines.load()
+    ocr_logger.info("OCR worker %s ready", os.getpid())
+
+def ocr_page_worker(engine, image, page_num, regions=None):
+    """Entry point for page OCR in a worker process. Returns (text, seconds)."""
+    start_time = time.time()
+    text = OCR_PAGE_ENGINES[engine](image, page_num, regions)
+    return text, time.time() - start_time
+
+ocr_pool = None
+ocr_pool_lock = threading.Lock()
+
+def get_ocr_pool():
+    """Return the shared page OCR process pool, or None when OCR runs in-process."""
+    global ocr_pool
+    if app.config['OCR_PROCESSES'] <= 0:
+        return None
+    with ocr_pool_lock:
+        if ocr_pool is None:
+            ocr_logger.info("Starting page OCR pool with %s processes", app.config['OCR_PROCESSES'])
+            # Spawn rather than fork so each worker gets a clean torch runtime
+            ocr_pool = ProcessPoolExecutor(max_workers=app.config['OCR_PROCESSES'],
+                                           mp_context=multiprocessing.get_context('spawn'),
+                                           initializer=init_ocr_worker)
+        return ocr_pool
+
+def reset_ocr_pool():
+    """Discard a broken page OCR pool so the next call starts a fresh one."""
+    global ocr_pool
+    with ocr_pool_lock:
+        if ocr_pool is not None:
+            ocr_pool.shutdown(wait=False, cancel_futures=True)
+            ocr_pool = None
+
+def render_pdf_page(pdf_bytes, page_num, dpi=OCR_BASE_DPI, doc=None, max_dimension=OCR_MAX_DIMENSION):
+    """Render a single PDF page (1-based) to a grayscale PIL image, or None if it could not be rendered.
+    
+    Uses the open PyMuPDF document when given, which renders straight from
+    memory at a DPI lowered so the longest side fits max_dimension; otherwise
+    falls back to poppler through pdf2image.
+    """
+    if doc is not None:
+        page = doc[page_num - 1]
+        dpi = min(dpi, max_dimension * 72 / max(page.rect.width, page.rect.height))
+        pixmap = page.get_pixmap(dpi=dpi, colorspace=fitz.csGRAY, alpha=False)
+        return Image.frombytes('L', (pixmap.width, pixmap.height), pixmap.samples)
+    images = convert_from_bytes(pdf_bytes, dpi=dpi, first_page=page_num, last_page=page_num, grayscale=True)
+    if not images:
+        return None
+    images[0].thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+    return images[0]
+
+class PageRegions:
+    """Renders regions of one PDF page at OCR_REFINE_DPI, to re-read low-confidence OCR lines."""
+    
+    def __init__(self, pdf_bytes, page_num, doc=None):
+        self.pdf_bytes = pdf_bytes
+        self.page_num = page_num
+        self.doc = doc
+    
+    def for_worker(self):
+        """Return a copy holding only this page, which is cheap to send to an OCR worker process."""
+        with fitz.open(stream=self.pdf_bytes, filetype='pdf') as source, fitz.open() as single_page:
+            single_page.insert_pdf(source, from_page=self.page_num - 1, to_page=self.page_num - 1)
+            return PageRegions(single_page.tobytes(), 1)
+    
+    def detached(self):
+        """Return a copy that opens its own document on first render, for use from another thread."""
+        return PageRegions(self.pdf_bytes, self.page_num)
+    
+    def render(self, region, dpi=OCR_REFINE_DPI):
+        """Render a region, given as fractions (x0, y0, x1, y1) of the page, to a grayscale image."""
+        if self.doc is None:
+            self.doc = fitz.open(stream=self.pdf_bytes, filetype='pdf')
+        page = self.doc[self.page_num - 1]
+        rect = page.rect
+        clip = fitz.Rect(rect.x0 + region[0] * rect.width, rect.y0 + region[1] * rect.height,
+                         rect.x0 + region[2] * rect.width, rect.y0 + region[3] * rect.height) & rect
+        pixmap = page.get_pixmap(dpi=dpi, colorspace=fitz.csGRAY, clip=clip, alpha=False)
+        return Image.frombytes('L', (pixmap.width, pixmap.height), pixmap.samples)
+
+class RenderedPages:
+    """Lazily rendered pages of a PDF, shared by every OCR engine in the fallback chain.
+    
+    Pages are rendered one at a time as they are iterated. Pages listed in
+    keep_pages are rendered at keep_dpi and kept so a fallback engine can
+    reuse them without rendering the PDF again, and are downscaled when
+    yielded at a lower dpi; other pages are released as soon as the
+    consumer moves on, so memory use does not grow with the length of the PDF.
+    """
+    
+    def __init__(self, pdf_bytes, dpi=OCR_BASE_DPI, keep_pages=(), keep_dpi=None, page_count=None):
+        self.pdf_bytes = pdf_bytes
+        self.dpi = dpi
+        self.keep_pages = set(keep_pages)
+        self.keep_dpi = keep_dpi or dpi
+        self.pages = {}  # page_num -> image, for pages we keep for reuse
+        self.rendered = 0
+        self.reused = 0
+        self._page_count = page_count
+        self.doc = fitz.open(stream=pdf_bytes, filetype='pdf') if PYMUPDF_AVAILABLE else None
+    
+    @property
+    def page_count(self):
+        if self._page_count is None:
+            if self.doc is not None:
+                self._page_count = self.doc.page_count
+            else:
+                self._page_count = pdfinfo_from_bytes(self.pdf_bytes)['Pages']
+        return self._page_count
+    
+    def use_dpi(self, dpi):
+        """Yield pages from now on at dpi. Kept pages are reused, downscaled if dpi is below keep_dpi."""
+        self.dpi = dpi
+    
+    def iter_pages(self, page_nums):
+        """Yield (page_num, image, regions) for the given 1-based page numbers, rendering only pages not already kept.
         
-        logger.info(f"Processing PDF using temp file: {temp_file.name}")
+        regions is a PageRegions for re-rendering parts of the page at a higher DPI,
+        or None when PyMuPDF is not available.
+        """
+        for page_num in page_nums:
+            keep = page_num in self.keep_pages
+            image = self.pages.get(page_num)
+            if image is not None:
+                self.reused += 1
+                record_stat('pdf_pages_reused')
+            else:
+                start_render = time.time()
+                image = render_pdf_page(self.pdf_bytes, page_num, self.keep_dpi if keep else self.dpi, self.doc)
+                if image is None:
+                    pdf_logger.warning("Could not render page %s", page_num)
+                    continue
+                self.rendered += 1
+                record_stat('pdf_pages_rendered')
+                render_time = time.time() - start_render
+                record_timing('pdf_rasterize', render_time)
+                pdf_logger.debug("Rendered page %s/%s in %.2f seconds", page_num, self.page_count, render_time)
+                if keep:
+                    self.pages[page_num] = image
+            if keep and self.dpi < self.keep_dpi:
+                scale = self.dpi / self.keep_dpi
+                image = image.resize((round(image.width * scale), round(image.height * scale)), Image.LANCZOS)
+            regions = PageRegions(self.pdf_bytes, page_num, self.doc) if self.doc is not None else None
+            yield page_num, image, regions
+    
+    def release(self):
+        """Drop all kept page images and close the document."""
+        self.pages.clear()
+        if self.doc is not None:
+            self.doc.close()
+            self.doc = None
+
+page_threads = None
+page_threads_lock = threading.Lock()
+
+def get_page_threads():
+    """Return the thread pool that OCRs pages in-process when their lines are recognized in shared batches."""
+    global page_threads
+    if get_recognition_batcher() is None:
+        return None
+    with page_threads_lock:
+        if page_threads is None:
+            page_threads = ThreadPoolExecutor(max_workers=max(1, app.config['EASYOCR_PAGE_THREADS']),
+                                              thread_name_prefix='easyocr-page')
+        return page_threads
+
+def ocr_page_local(engine, image, page_num, regions=None):
+    """OCR a single page in this process. Returns (text, seconds)."""
+    return ocr_page_worker(engine, image, page_num, regions)
+
+def ocr_pages(pages, engine, on_page=None):
+    """OCR an iterable of (page_num, image, regions) tuples from RenderedPages.iter_pages.
+    
+    Returns a list of (page_num, text, seconds) in the order the pages were
+    given. Pages are spread across the process pool when OCR_PROCESSES is
+    set, otherwise they are processed one after another in this process.
+    Pages are pulled from the iterable as workers free up, so a page
+    generator is never rendered far ahead of the OCR. on_page, if given, is
+    called with (page_num, text, seconds) as each page finishes.
+    """
+    start_time = time.time()
+    results = []
+    pool = get_ocr_pool()
+    threads = get_page_threads() if pool is None and engine == 'easyocr' else None
+    pending = deque()  # (future, image, page_num, regions) in page order
+    if threads is not None:
+        window = max(1, app.config['EASYOCR_PAGE_THREADS']) * 2
+    else:
+        window = max(1, app.config['OCR_PROCESSES']) * 2
+    
+    def add(result):
+        results.append(result)
+        if on_page is not None:
+            on_page(*result)
+    
+    def finish(entry):
+        nonlocal pool
+        future, image, page_num, regions = entry
+        try:
+            text, seconds = future.result()
+        except BrokenProcessPool as e:
+            if pool is not None:
+                ocr_logger.error("Page OCR pool failed: %s. Processing pages in-process.", str(e))
+                reset_ocr_pool()
+                pool = None
+            text, seconds = ocr_page_local(engine, image, page_num, regions)
+        return page_num, text, seconds
+    
+    for page_num, image, regions in pages:
+        if threads is not None:
+            # Pages are OCRed side by side so their text lines share recognition batches.
+            # A document is not thread-safe, so each thread opens its own, and only if it re-reads a line.
+            thread_regions = regions.detached() if regions is not None else None
+            pending.append((threads.submit(ocr_page_local, engine, image, page_num, thread_regions),
+                            image, page_num, regions))
+            if len(pending) >= window:
+                add(finish(pending.popleft()))
+            continue
         
-        # Check if file exists and has content
-        if not os.path.exists(temp_file.name) or os.path.getsize(temp_file.name) == 0:
-            logger.error("Temporary PDF file is empty or does not exist")
+        if pool is not None:
+            try:
+                # Workers get their own copy of just this page to re-render regions from
+                worker_regions = regions.for_worker() if regions is not None and engine == 'easyocr' else None
+                pending.append((pool.submit(ocr_page_worker, engine, image, page_num, worker_regions),
+                                image, page_num, regions))
+            except BrokenProcessPool as e:
+                ocr_logger.error("Page OCR pool failed: %s. Processing pages in-process.", str(e))
+                reset_ocr_pool()
+                pool = None
+            else:
+                if len(pending) >= window:
+                    add(finish(pending.popleft()))
+                continue
+        
+        # In-process OCR; finish any pages already handed to the pool first to keep page order
+        while pending:
+            add(finish(pending.popleft()))
+        add((page_num,) + ocr_page_local(engine, image, page_num, regions))
+    
+    while pending:
+        add(finish(pending.popleft()))
+    
+    # Recorded here rather than in the workers, whose counters live in other processes
+    for _, _, seconds in results:
+        record_timing(f'pdf_page_ocr_{engine}', seconds)
+    ocr_logger.info("%s OCR of %s pages took %.2f seconds", engine, len(results), time.time() - start_time)
+    return results
+
+def log_page_timings(page_results):
+    """Log how each page of a PDF was extracted and how long it took."""
+    for page_num in sorted(page_results):
+        method, text, seconds = page_results[page_num]
+        ocr_logger.debug("Page %s: %s in %.2f seconds (%s chars)", page_num, method, seconds, len(text.strip()))
+        record_stat(f'pdf_pages_{method}')
+
+def keep_layer_text(page_results, layer_texts):
+    """Use the text layer of pages that OCR read nothing from."""
+    for page_num, text in layer_texts.items():
+        if page_num not in page_results or not page_results[page_num][1].strip():
+            page_results[page_num] = ('text', text, 0.0)
+
+def join_page_texts(page_results, page_texts=None):
+    """Join extracted page texts in page order, also copying them into page_texts if given."""
+    if page_texts is not None:
+        page_texts.update((page_num, text) for page_num, (_, text, _) in page_results.items())
+    return ''.join(page_results[page_num][1] + "\n" for page_num in sorted(page_results)
+                   if page_results[page_num][1])
+
+def process_pdf(pdf_bytes, progress=None, page_texts=None):
+    """Process PDF bytes (any bytes-like object) with multiple fallback methods.
+    
+    progress, if given, is called as progress('page', page=..., method=..., seconds=..., chars=...)
+    as each page's text is extracted, where chars counts the non-blank characters read. page_texts, if given, is a dict that is
+    filled with the extracted text of each page, keyed by page number.
+    """
+    rendered_pages = None
+    start_time = time.time()
+    
+    def report_page(method):
+        """Return an ocr_pages on_page callback that reports pages read with method."""
+        if progress is None:
+            return None
+        return lambda page_num, text, seconds: progress('page', page=page_num, method=method, seconds=round(seconds, 3),
+                                                        chars=len(text.strip()))
+    
+    try:
+        # Check if the file has content
+        if not pdf_bytes:
+            pdf_logger.error("PDF file is empty")
             return "ERROR: PDF file is empty or could not be saved"
         
         # Get file size for logging
-        file_size = os.path.getsize(temp_file.name) / 1024  # KB
-        logger.info(f"PDF file size: {file_size:.2f} KB")
+        file_size = len(pdf_bytes) / 1024  # KB
+        pdf_logger.info("PDF file size: %.2f KB", file_size)
         
-        extracted_text = ""
+        page_results = {}  # page_num -> (method, text, seconds)
+        layer_texts = {}  # page_num -> short text layer of a page sent to OCR, kept if OCR reads nothing
+        ocr_page_nums = None  # Pages that need OCR, None for all pages
+        page_count = None
         
         # First, try to extract text directly from the PDF as it's faster
         try:
-            logger.info("Attempting to extract text directly from PDF (faster method)")
+            pdf_logger.info("Attempting to extract text directly from PDF (faster method)")
             start_direct = time.time()
             
-            # Try PyMuPDF first (more reliable for text extraction)
+            # Try PyMuPDF first (more reliable for text extraction); it decides per page
             if PYMUPDF_AVAILABLE:
-                logger.info("Using PyMuPDF for text extraction")
-                with fitz.open(temp_file.name) as doc:
-                    text_content = ""
-                    for page_num, page in enumerate(doc):
-                        text_content += page.get_text()
-                        logger.info(f"Extracted text from page {page_num+1} with PyMuPDF")
+                pdf_logger.info("Using PyMuPDF for text extraction")
+                with fitz.open(stream=pdf_bytes, filetype='pdf') as doc:
+                    page_count = doc.page_count
+                    image_pages = []
+                    for page_num, page in enumerate(doc, 1):
+                        start_page = time.time()
+                        page_text = page.get_text()
+                        # A page is OCRed only if it has no text layer, or embedded images
+                        # (a scan) with little text; otherwise its exact text is kept
+                        if page_text.strip() and (len(page_text.strip()) >= PAGE_TEXT_MIN_CHARS or not page.get_images()):
+                            page_results[page_num] = ('text', page_text, time.time() - start_page)
+                            pdf_logger.debug("Extracted text from page %s with PyMuPDF", page_num)
+                            if progress is not None:
+                                progress('page', page=page_num, method='text', seconds=round(page_results[page_num][2], 3),
+                                         chars=len(page_text.strip()))
+                        else:
+                            if page_text.strip():
+                                layer_texts[page_num] = page_text
+                            image_pages.append(page_num)
                     
-                    # Check if we got meaningful text (not just whitespace or very little content)
-                    if text_content and len(text_content.strip()) > 50:
-                        logger.info("Successfully extracted text with PyMuPDF")
-                        direct_time = time.time() - start_direct
-                        logger.info(f"PyMuPDF extraction took {direct_time:.2f} seconds")
-                        return text_content
+                    direct_time = time.time() - start_direct
+                    record_timing('pdf_text_pymupdf', direct_time)
+                    pdf_logger.info("PyMuPDF extraction took %.2f seconds", direct_time)
+                    
+                    if page_results and not image_pages:
+                        pdf_logger.info("Successfully extracted text with PyMuPDF")
+                        log_page_timings(page_results)
+                        return join_page_texts(page_results, page_texts)
+                    elif page_results:
+                        # Mixed PDF: keep the text layer and only OCR the scanned or empty pages
+                        pdf_logger.info("PyMuPDF found a text layer on %s of %s pages. OCRing scanned pages: %s",
+                                        len(page_results), page_count, image_pages)
+                        ocr_page_nums = image_pages
                     else:
-                        logger.warning("PyMuPDF extracted minimal text, likely an image-based PDF")
+                        pdf_logger.warning("PyMuPDF extracted minimal text, likely an image-based PDF")
+                        record_stat('pdf_pypdf2_fallbacks')
             
-            # Fallback to PyPDF2
-            logger.info("Trying PyPDF2 for text extraction")
-            pdf_reader = PyPDF2.PdfReader(temp_file.name)
-            
-            # Check if PDF is encrypted/password protected
-            if pdf_reader.is_encrypted:
-                logger.warning("PDF is encrypted. Cannot extract text directly.")
-            else:
-                # Extract text from each page
-                pdf_text = ""
-                for i, page in enumerate(pdf_reader.pages):
-                    try:
-                        page_text = page.extract_text()
-                        if page_text and page_text.strip() != '':
-                            pdf_text += page_text + "\n"
-                            logger.info(f"Extracted text directly from PDF page {i+1} with PyPDF2")
-                    except Exception as e:
-                        logger.error(f"Error extracting text from PDF page {i+1}: {str(e)}")
+            if ocr_page_nums is None:
+                # Fallback to PyPDF2
+                pdf_logger.info("Trying PyPDF2 for text extraction")
+                start_pypdf2 = time.time()
+                pdf_reader = PyPDF2.PdfReader(io.BytesIO(pdf_bytes))
                 
-                direct_time = time.time() - start_direct
-                logger.info(f"Direct PDF extraction took {direct_time:.2f} seconds")
-                
-                # Check if we got meaningful text (not just whitespace or very little content)
-                if pdf_text and len(pdf_text.strip()) > 50:
-                    logger.info("Successfully extracted text directly from PDF")
-                    return pdf_text
+                # Check if PDF is encrypted/password protected
+                if pdf_reader.is_encrypted:
+                    pdf_logger.warning("PDF is encrypted. Cannot extract text directly.")
                 else:
-                    logger.warning("Minimal text extracted with PDF readers, likely an image-based PDF. Switching to OCR.")
+                    # Extract text from each page
+                    pdf_text = ""
+                    pypdf2_pages = {}
+                    for i, page in enumerate(pdf_reader.pages):
+                        try:
+                            page_text = page.extract_text()
+                            if page_text and page_text.strip() != '':
+                                pdf_text += page_text + "\n"
+                                pypdf2_pages[i + 1] = page_text
+                                pdf_logger.debug("Extracted text directly from PDF page %s with PyPDF2", i+1)
+                        except Exception as e:
+                            pdf_logger.error("Error extracting text from PDF page %s: %s", i+1, str(e))
+                    
+                    direct_time = time.time() - start_direct
+                    record_timing('pdf_text_pypdf2', time.time() - start_pypdf2)
+                    pdf_logger.info("Direct PDF extraction took %.2f seconds", direct_time)
+                    
+                    # Check if we got meaningful text (not just whitespace or very little content)
+                    if pdf_text and len(pdf_text.strip()) > 50:
+                        pdf_logger.info("Successfully extracted text directly from PDF")
+                        if page_texts is not None:
+                            page_texts.update(pypdf2_pages)
+                        if progress is not None:
+                            for page_num in range(1, len(pdf_reader.pages) + 1):
+                                progress('page', page=page_num, method='pypdf2', seconds=None,
+                                         chars=len(pypdf2_pages.get(page_num, '').strip()))
+                        return pdf_text
+                    else:
+                        pdf_logger.warning("Minimal text extracted with PDF readers, likely an image-based PDF. Switching to OCR.")
         except Exception as e:
-            logger.error(f"Error extracting text directly from PDF: {str(e)}")
-            logger.warning("PDF appears to be image-based. Switching to OCR.")
+            pdf_logger.error("Error extracting text directly from PDF: %s", str(e))
+            pdf_logger.warning("PDF appears to be image-based. Switching to OCR.")
         
-        # If we reach here, direct extraction failed or returned minimal text
-        # This suggests the PDF is likely image-based, so we'll use OCR
-        logger.info("Using OCR for image-based PDF")
+        # If we reach here, direct extraction failed or some pages have no text layer
+        # Those pages are likely image-based, so we'll use OCR
+        pdf_logger.info("Using OCR for image-based PDF pages")
+        record_stat('pdf_ocr_documents')
+        
+        # EasyOCR reads pages at a lower resolution than Tesseract. The pages Tesseract would fall
+        # back to are rendered once at its resolution, downscaled for EasyOCR and kept for the fallback;
+        # when Tesseract runs on its own, every page is released once it is read
+        rendered_pages = RenderedPages(pdf_bytes, OCR_BASE_DPI if ocr_engines.available else TESSERACT_DPI,
+                                       keep_dpi=TESSERACT_DPI, page_count=page_count)
+        if ocr_page_nums is None:
+            ocr_page_nums = list(range(1, rendered_pages.page_count + 1))
+        if ocr_engines.available and check_tesseract_installed()[0]:
+            rendered_pages.keep_pages = set(ocr_page_nums[:TESSERACT_MAX_PAGES])
         
         # First, try to process with EasyOCR if available
-        if EASYOCR_AVAILABLE and reader is not None:
+        if ocr_engines.available:
             try:
-                logger.info("Converting PDF to images for EasyOCR processing")
-                start_convert = time.time()
-                
-                # Use higher DPI for better quality (200 instead of 150)
-                images = convert_from_path(temp_file.name, dpi=200)
+                # Pages are rendered lazily, only up to the EasyOCR page limit
+                if len(ocr_page_nums) > EASYOCR_MAX_PAGES:
+                    pdf_logger.info("Only OCRing the first %s of %s pages for performance reasons", EASYOCR_MAX_PAGES, len(ocr_page_nums))
+                pdf_logger.info("Rendering PDF pages for EasyOCR processing")
+                ocr_results = ocr_pages(rendered_pages.iter_pages(ocr_page_nums[:EASYOCR_MAX_PAGES]), 'easyocr',
+                                        report_page('easyocr'))
                 
-                convert_time = time.time() - start_convert
-                logger.info(f"PDF to image conversion took {convert_time:.2f} seconds for {len(images)} pages")
-                
-                if images:
-                    # Extract text from each page
-                    for i, image in enumerate(images):
-                        try:
-                            # Process all pages (up to a reasonable limit)
-                            if i >= 10:  # Process up to 10 pages
-                                logger.info(f"Skipping page {i+1} and beyond for performance reasons")
-                                break
-                                
-                            logger.info(f"Processing page {i+1}/{len(images)} with EasyOCR")
-                            
-                            # Resize large images for faster processing
-                            width, height = image.size
-                            if width > 2500 or height > 2500:
-                                scale = min(2500/width, 2500/height)
-                                new_width = int(width * scale)
-                                new_height = int(height * scale)
-                                logger.info(f"Resizing image from {width}x{height} to {new_width}x{new_height}")
-                                image = image.resize((new_width, new_height), Image.LANCZOS)
-                            
-                            # Process with EasyOCR
-                            result = reader.readtext(np.array(image))
-                            page_text = '\n'.join([item[1] for item in result])
-                            
-                            if page_text and page_text.strip() != '':
-                                extracted_text += page_text + "\n"
-                                logger.info(f"EasyOCR: Extracted text from page {i+1}")
-                            else:
-                                logger.warning(f"EasyOCR: No text found on page {i+1}")
-                        except Exception as ocr_error:
-                            logger.error(f"Error in EasyOCR for page {i+1}: {str(ocr_error)}")
-                    
-                    if extracted_text and extracted_text.strip() != '':
-                        total_time = time.time() - start_time
-                        logger.info(f"Successfully extracted text with EasyOCR in {total_time:.2f} seconds")
-                        return extracted_text
-                    else:
-                        logger.warning("EasyOCR failed to extract any text. Falling back to Tesseract.")
+                if any(text and text.strip() != '' for _, text, _ in ocr_results):
+                    for page_num, text, seconds in ocr_results:
+                        page_results[page_num] = ('easyocr', text, seconds)
+                    keep_layer_text(page_results, layer_texts)
+                    total_time = time.time() - start_time
+                    pdf_logger.info("Successfully extracted text with EasyOCR in %.2f seconds", total_time)
+                    log_page_timings(page_results)
+                    return join_page_texts(page_results, page_texts)
+                else:
+                    pdf_logger.warning("EasyOCR failed to extract any text. Falling back to Tesseract.")
             except Exception as e:
-                logger.error(f"Error using EasyOCR: {str(e)}")
-                logger.info("Falling back to Tesseract OCR")
+                pdf_logger.error("Error using EasyOCR: %s", str(e))
+                pdf_logger.info("Falling back to Tesseract OCR")
+            record_stat('pdf_tesseract_fallbacks')
         
         # Fallback to Tesseract method if EasyOCR fails or is not available
         is_installed, message = check_tesseract_installed()
         if not is_installed:
-            logger.warning(message)
+            pdf_logger.warning(message)
+            keep_layer_text(page_results, layer_texts)
             # If we've tried everything and failed, return an error
-            if not extracted_text or extracted_text.strip() == '':
-                logger.error("All text extraction methods failed")
+            if not page_results:
+                pdf_logger.error("All text extraction methods failed")
                 return "ERROR: Could not extract text from PDF using any method"
-            return extracted_text
+            log_page_timings(page_results)
+            return join_page_texts(page_results, page_texts)
         
-        # Use Tesseract as last resort
-        logger.info("Converting PDF to images for Tesseract OCR processing")
+        # Use Tesseract as last resort, limited to the first few pages for performance
+        pdf_logger.info("Processing up to %s PDF pages with Tesseract OCR", TESSERACT_MAX_PAGES)
+        rendered_pages.use_dpi(TESSERACT_DPI)
+        ocr_results = ocr_pages(rendered_pages.iter_pages(ocr_page_nums[:TESSERACT_MAX_PAGES]), 'tesseract',
+                                report_page('tesseract'))
+        pdf_logger.info("Tesseract fallback reused %s already rendered pages", rendered_pages.reused)
         
-        # Use higher DPI for better quality
-        images = convert_from_path(temp_file.name, dpi=200)
-        logger.info(f"Successfully converted PDF to {len(images)} images")
+        for page_num, text, seconds in ocr_results:
+            page_results[page_num] = ('tesseract', text, seconds)
+        keep_layer_text(page_results, layer_texts)
         
-        if images:
-            # Extract text from each page, but limit to first few pages for performance
-            max_pages = min(5, len(images))  # Process at most 5 pages with Tesseract
-            logger.info(f"Processing only first {max_pages} pages with Tesseract for performance")
-            
-            for i in range(max_pages):
-                try:
-                    page_text = process_image(images[i])
-                    if page_text and not page_text.startswith("ERROR:"):
-                        extracted_text += page_text + "\n"
-                        logger.info(f"Extracted text from page {i+1}")
-                    else:
-                        logger.warning(f"Failed to extract text from page {i+1}: {page_text}")
-                except Exception as ocr_error:
-                    logger.error(f"Error in OCR for page {i+1}: {str(ocr_error)}")
+        if page_results:
+            extracted_text = join_page_texts(page_results, page_texts)
             
             if extracted_text and extracted_text.strip() != '':
                 total_time = time.time() - start_time
-                logger.info(f"Successfully extracted text with Tesseract in {total_time:.2f} seconds")
+                pdf_logger.info("Successfully extracted text with Tesseract in %.2f seconds", total_time)
+                log_page_timings(page_results)
                 return extracted_text
             else:
-                logger.error("Failed to extract text with all methods")
+                pdf_logger.error("Failed to extract text with all methods")
                 return "ERROR: Could not extract text from PDF using any method"
         else:
-            logger.error("Failed to convert PDF to images")
+            pdf_logger.error("Failed to render PDF pages")
             return "ERROR: Could not convert PDF to images for OCR"
     
     except Exception as e:
         message = f"Error processing PDF: {str(e)}\n{traceback.format_exc()}"
-        logger.error(message)
+        pdf_logger.error(message)
         return f"ERROR: {message}"
     
     finally:
-        # Clean up temporary file
-        if temp_file and os.path.exists(temp_file.name):
+        if rendered_pages is not None:
+            rendered_pages.release()
+
+class ExtractionCache:
+    """On-disk cache of extracted document text, keyed by content hash and extraction settings.
+    
+    Entries are JSON files in the cache directory. When the total size exceeds
+    the limit, the least recently used entries are evicted.
+    """
+    
+    VERSION = 2  # Bump when extraction output changes to invalidate old entries
+    
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()  # key -> size in bytes, least recently used first
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        
+        if self.enabled:
+            os.makedirs(directory, exist_ok=True)
+            self._load_index()
+    
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+    
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+    
+    def _load_index(self):
+        """Rebuild the LRU order from the entries already on disk."""
+        found = []
+        for name in os.listdir(self.directory):
+            if not name.endswith('.json'):
+                continue
             try:
-                os.unlink(temp_file.name)
-                logger.info(f"Deleted temporary file {temp_file.name}")
-            except Exception as e:
-                logger.error(f"Error deleting temporary file: {str(e)}")
-
-def calculate_tax(income, filing_status):
-    # 2024 tax brackets (simplified)
-    brackets = {
-        'single': [
-            (11600, 0.10),
-            (47150, 0.12),
-            (100525, 0.22),
-            (191950, 0.24),
-            (243725, 0.32),
-            (609350, 0.35),
-            (float('inf'), 0.37)
-        ],
-        'married_jointly': [
-            (23200, 0.10),
-            (94300, 0.12),
-            (201050, 0.22),
-            (383900, 0.24),
-            (487450, 0.32),
-            (731200, 0.35),
-            (float('inf'), 0.37)
-        ],
-        'married_separate': [
-            (11600, 0.10),
-            (47150, 0.12),
-            (100525, 0.22),
-            (191950, 0.24),
-            (243725, 0.32),
-            (365600, 0.35),
-            (float('inf'), 0.37)
-        ],
-        'head_household': [
-            (16550, 0.10),
-            (63100, 0.12),
-            (100500, 0.22),
-            (191950, 0.24),
-            (243700, 0.32),
-            (609350, 0.35),
-            (float('inf'), 0.37)
-        ]
-    }
+                stat = os.stat(os.path.join(self.directory, name))
+                found.append((stat.st_mtime, name[:-5], stat.st_size))
+            except OSError:
+                continue
+        for _, key, size in sorted(found):
+            self.entries[key] = size
+            self.total_bytes += size
+        logger.info("Extraction cache loaded %d entries (%.2f KB)", len(self.entries), self.total_bytes / 1024)
+    
+    def make_key(self, data, kind):
+        """Build a cache key from the document bytes and the settings that affect extraction."""
+        settings = f"v{self.VERSION}:{kind}:{ocr_engine_availability()}:dpi={OCR_BASE_DPI},{OCR_REFINE_DPI},{TESSERACT_DPI},{OCR_MAX_DIMENSION}:pages={EASYOCR_MAX_PAGES},{TESSERACT_MAX_PAGES}"
+        digest = hashlib.sha256(data)
+        digest.update(settings.encode())
+        return digest.hexdigest()
+    
+    def get(self, key):
+        """Return the cached entry ({'text': ..., 'pages': ..., 'engine': ...}) or None."""
+        if not self.enabled:
+            return None
+        with self.lock:
+            if key not in self.entries:
+                self.misses += 1
+                return None
+            try:
+                with open(self._path(key), 'r', encoding='utf-8') as f:
+                    entry = json.load(f)
+                os.utime(self._path(key))
+            except (OSError, ValueError) as e:
+                logger.warning("Dropping unreadable extraction cache entry %s: %s", key, e)
+                self._remove(key)
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry
+    
+    def put(self, key, text, pages, engine):
+        """Store the extracted text of a document with its per-page text and the engine that read it."""
+        if not self.enabled:
+            return
+        payload = json.dumps({'text': text, 'pages': {str(page_num): pages[page_num] for page_num in sorted(pages)},
+                              'engine': engine})
+        size = len(payload.encode('utf-8'))
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            try:
+                tmp_path = self._path(key) + '.tmp'
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    f.write(payload)
+                os.replace(tmp_path, self._path(key))
+            except OSError as e:
+                logger.warning("Could not write extraction cache entry %s: %s", key, e)
+                return
+            self.total_bytes += size - self.entries.pop(key, 0)
+            self.entries[key] = size
+            
+            # Evict least recently used entries until we are back under the limit
+            while self.total_bytes > self.max_bytes and self.entries:
+                self._remove(next(iter(self.entries)))
+    
+    def _remove(self, key):
+        """Remove an entry from disk and the index. Caller must hold the lock."""
+        self.total_bytes -= self.entries.pop(key, 0)
+        try:
+            os.unlink(self._path(key))
+        except OSError:
+            pass
+
+def ocr_engine_availability():
+    """Which OCR engines are usable, as part of the extraction cache key."""
+    tesseract_available, _ = check_tesseract_installed()
+    return f"easyocr={int(ocr_engines.available)},tesseract={int(tesseract_available)}"
+
+extraction_cache = ExtractionCache(app.config['EXTRACTION_CACHE_DIR'],
+                                   app.config['EXTRACTION_CACHE_MAX_MB'] * 1024 * 1024)
+
+# Filing statuses in code order for the batch API; code 0 is also the fallback for unknown statuses
+FILING_STATUSES = ('single', 'married_jointly', 'married_separate', 'head_household')
+FILING_STATUS_CODES = {status: code for code, status in enumerate(FILING_STATUSES)}
+
+BracketTable = namedtuple('BracketTable', ['lower', 'rate', 'base_tax'])
+TaxYear = namedtuple('TaxYear', ['year', 'brackets', 'standard_deductions',
+                                 'bracket_lower', 'bracket_rate', 'bracket_base_tax'])
+TaxBatchResult = namedtuple('TaxBatchResult', ['tax', 'marginal_rate', 'effective_rate'])
+
+def build_bracket_table(brackets):
+    """Precompute each bracket's lower bound and the cumulative tax owed at that bound."""
+    lower, rate, base_tax = [], [], []
+    prev_limit = 0
+    tax = 0
+    for limit, bracket_rate in brackets:
+        lower.append(prev_limit)
+        rate.append(bracket_rate)
+        base_tax.append(tax)
+        tax += (limit - prev_limit) * bracket_rate
+        prev_limit = limit
+    return BracketTable(tuple(lower), tuple(rate), tuple(base_tax))
+
+def read_only_array(rows, fill):
+    """Stack rows of possibly different lengths into a read-only 2D array, padding with fill."""
+    width = max(len(row) for row in rows)
+    array = np.array([list(row) + [fill] * (width - len(row)) for row in rows], dtype=float)
+    array.setflags(write=False)
+    return array
+
+def parse_tax_year(year, data):
+    """Validate one year of tax table data and build its frozen TaxYear."""
+    brackets = {}
+    standard_deductions = {}
+    for status in FILING_STATUSES:
+        status_brackets = data['brackets'].get(status)
+        if not status_brackets:
+            raise ValueError(f"Tax year {year} has no brackets for {status}")
+        
+        parsed = []
+        prev_limit = 0
+        for i, (limit, rate) in enumerate(status_brackets):
+            is_last = i == len(status_brackets) - 1
+            # The top bracket has no upper limit
+            limit = float('inf') if limit is None else float(limit)
+            if is_last != (limit == float('inf')):
+                raise ValueError(f"Tax year {year} {status}: only the last bracket may be unbounded")
+            if limit <= prev_limit:
+                raise ValueError(f"Tax year {year} {status}: bracket limits must increase")
+            if not 0 <= rate < 1:
+                raise ValueError(f"Tax year {year} {status}: invalid rate {rate}")
+            parsed.append((limit, float(rate)))
+            prev_limit = limit
+        brackets[status] = build_bracket_table(parsed)
+        
+        deduction = data['standard_deduction'].get(status)
+        if deduction is None or deduction < 0:
+            raise ValueError(f"Tax year {year} has no valid standard deduction for {status}")
+        standard_deductions[status] = float(deduction)
+    
+    tables = [brackets[status] for status in FILING_STATUSES]
+    return TaxYear(
+        year=year,
+        brackets=MappingProxyType(brackets),
+        standard_deductions=MappingProxyType(standard_deductions),
+        # Padding brackets start at infinity so no income ever reaches them
+        bracket_lower=read_only_array([table.lower for table in tables], float('inf')),
+        bracket_rate=read_only_array([table.rate for table in tables], 0.0),
+        bracket_base_tax=read_only_array([table.base_tax for table in tables], 0.0)
+    )
+
+def load_tax_tables(path):
+    """Load and validate the tax table data file. Returns (tables by year, default year)."""
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
     
+    tables = {int(year): parse_tax_year(int(year), year_data) for year, year_data in data['years'].items()}
+    default_year = int(data.get('default_year', max(tables)))
+    if default_year not in tables:
+        raise ValueError(f"Default tax year {default_year} is not in {path}")
+    tax_logger.info("Loaded tax tables for %s from %s", ', '.join(str(year) for year in sorted(tables)), path)
+    return MappingProxyType(tables), default_year
+
+# Parsed once at startup; indexed as TAX_TABLES[year].brackets[status]
+TAX_TABLES, DEFAULT_TAX_YEAR = load_tax_tables(app.config['TAX_TABLES_PATH'])
+
+def get_tax_year(tax_year=None):
+    """Return the TaxYear tables for a year (the default year if None). Raises ValueError if unknown."""
+    if tax_year is None or tax_year == '':
+        return TAX_TABLES[DEFAULT_TAX_YEAR]
+    try:
+        return TAX_TABLES[int(tax_year)]
+    except (KeyError, ValueError, TypeError):
+        valid_years = ', '.join(str(year) for year in sorted(TAX_TABLES))
+        raise ValueError(f'Invalid tax year: "{tax_year}". Must be one of: {valid_years}')
+
+def filing_status_codes(filing_statuses, size):
+    """Map filing statuses (a single status, names, or integer codes) to an array of codes; unknown ones map to 0."""
+    if isinstance(filing_statuses, str):
+        return np.full(size, FILING_STATUS_CODES.get(filing_statuses, 0), dtype=np.intp)
+    statuses = np.asarray(filing_statuses)
+    if statuses.dtype.kind in 'iu':
+        # Codes outside the table are unknown statuses, which use single (code 0)
+        codes = statuses.astype(np.intp)
+        return np.where((codes < 0) | (codes >= len(FILING_STATUSES)), 0, codes)
+    # Look up each distinct status once rather than once per element
+    unique_statuses, inverse = np.unique(statuses, return_inverse=True)
+    unique_codes = np.array([FILING_STATUS_CODES.get(status, 0) for status in unique_statuses], dtype=np.intp)
+    return unique_codes[inverse]
+
+def calculate_tax_batch(incomes, filing_statuses, tax_year=None):
+    """Calculate tax for many taxable incomes in one vectorized pass.
+    
+    filing_statuses is a single status, or an array of status names or
+    FILING_STATUS_CODES matching incomes. Unknown statuses use single
+    brackets. Returns a TaxBatchResult of arrays: tax, marginal rate and
+    effective rate.
+    """
+    year = get_tax_year(tax_year)
+    incomes = np.asarray(incomes, dtype=float)
+    codes = filing_status_codes(filing_statuses, incomes.size).reshape(incomes.shape)
+    
+    lower = year.bracket_lower[codes]
+    # Index of the bracket each income falls in; brackets include their upper limit
+    bracket = np.maximum((incomes[..., None] > lower).sum(axis=-1) - 1, 0)
+    bracket_lower = np.take_along_axis(lower, bracket[..., None], axis=-1)[..., 0]
+    marginal_rate = year.bracket_rate[codes, bracket]
+    
+    tax = year.bracket_base_tax[codes, bracket] + (incomes - bracket_lower) * marginal_rate
+    tax = np.where(incomes > 0, tax, 0.0)
+    effective_rate = np.divide(tax, incomes, out=np.zeros_like(tax), where=incomes > 0)
+    return TaxBatchResult(tax, marginal_rate, effective_rate)
+
+def calculate_tax(income, filing_status, tax_year=None):
+    """Calculate tax on a single taxable income using the precomputed bracket table."""
+    year = get_tax_year(tax_year)
     # Use the correct bracket based on filing status, fallback to single if not found
-    selected_brackets = brackets.get(filing_status, brackets['single'])
+    table = year.brackets.get(filing_status, year.brackets['single'])
     
     tax = 0
-    prev_limit = 0
+    if income > 0:
+        bracket = bisect.bisect_left(table.lower, income) - 1
+        tax = table.base_tax[bracket] + (income - table.lower[bracket]) * table.rate[bracket]
     
-    # Calculate tax based on progressive brackets
-    for limit, rate in selected_brackets:
-        if income > prev_limit:
-            taxable_amount = min(income - prev_limit, limit - prev_limit)
-            tax += taxable_amount * rate
-            logger.info(f"Bracket: {prev_limit}-{limit}, Rate: {rate}, Taxable: {taxable_amount}, Tax Added: {taxable_amount * rate}")
-        prev_limit = limit
-        if income <= limit:
-            break
-            
-    logger.info(f"Final calculated tax for {filing_status} with income {income}: {tax}")
+    tax_logger.debug("Final calculated %s tax for %s with income %s: %s", year.year, filing_status, income, tax)
     return tax
 
-def get_standard_deduction(tax_status):
-    # 2024 standard deductions (simplified)
-    deductions = {
-        'single': 13750,
-        'married_jointly': 27500,
-        'married_separate': 13750,
-        'head_household': 20600
-    }
-    
-    deduction = deductions.get(tax_status, deductions['single'])
-    logger.info(f"Standard deduction for {tax_status}: {deduction}")
+def get_standard_deduction(tax_status, tax_year=None):
+    year = get_tax_year(tax_year)
+    deduction = year.standard_deductions.get(tax_status, year.standard_deductions['single'])
+    tax_logger.debug("%s standard deduction for %s: %s", year.year, tax_status, deduction)
     return deduction
 
-def process_tax_documents(files, tax_status):
-    """Process a list of tax documents and return tax information."""
-    logger.info(f"Starting to process {len(files)} tax documents with tax status: {tax_status}")
+MAX_SCENARIOS = 10000
+
+def parse_amount(value):
+    """Parse a dollar amount given as a number or a formatted string like '1,234.56'."""
+    if isinstance(value, str):
+        value = value.replace(',', '').replace('$', '').strip() or 0
+    amount = float(value)
+    if not np.isfinite(amount):
+        raise ValueError(f"amount must be a finite number, got {value!r}")
+    return amount
+
+def parse_amount_list(data, key):
+    """Parse a JSON list of dollar amounts. A missing or empty list means no adjustment."""
+    values = data.get(key, [0])
+    if not isinstance(values, list):
+        raise ValueError(f"{key} must be a list of amounts")
+    return [parse_amount(v) for v in values] or [0]
+
+def evaluate_scenarios(total_income, itemized_deductions, tax_paid, statuses,
+                       income_adjustments=(0,), deduction_adjustments=(0,), tax_year=None):
+    """Evaluate every combination of filing status and income/deduction adjustment in one batch.
+    
+    Each scenario takes the larger of the standard deduction and the adjusted
+    itemized deductions, the same choice process_tax_documents makes.
+    Returns (scenarios, best): one result dict per scenario, ordered by
+    status, then income adjustment, then deduction adjustment; and the
+    lowest-tax status for each income/deduction adjustment.
+    """
+    income_adjustments = np.asarray(income_adjustments, dtype=float)
+    deduction_adjustments = np.asarray(deduction_adjustments, dtype=float)
+    status_index, income_grid, deduction_grid = (grid.ravel() for grid in np.meshgrid(
+        np.arange(len(statuses)), income_adjustments, deduction_adjustments, indexing='ij'))
+    codes = np.array([FILING_STATUS_CODES.get(status, 0) for status in statuses], dtype=np.intp)[status_index]
+    
+    incomes = np.maximum(0, total_income + income_grid)
+    itemized = np.maximum(0, itemized_deductions + deduction_grid)
+    year = get_tax_year(tax_year)
+    standard = np.array([year.standard_deductions[status] for status in FILING_STATUSES], dtype=float)[codes]
+    use_standard = itemized < standard
+    deductions = np.where(use_standard, standard, itemized)
+    taxable = np.maximum(0, incomes - deductions)
+    
+    result = calculate_tax_batch(taxable, codes, year.year)
+    refund_or_owe = tax_paid - result.tax
+    
+    scenarios = []
+    for i in range(codes.size):
+        status = statuses[status_index[i]]
+        scenarios.append({
+            'tax_status': status,
+            'tax_status_label': VALID_TAX_STATUSES.get(status, status),
+            'income_adjustment': '{:,.2f}'.format(income_grid[i]),
+            'deduction_adjustment': '{:,.2f}'.format(deduction_grid[i]),
+            'total_income': '{:,.2f}'.format(incomes[i]),
+            'total_deductions': '{:,.2f}'.format(deductions[i]),
+            'use_standard_deduction': bool(use_standard[i]),
+            'taxable_income': '{:,.2f}'.format(taxable[i]),
+            'tax': '{:,.2f}'.format(result.tax[i]),
+            'tax_rate': '{:.2f}%'.format(result.effective_rate[i] * 100),
+            'marginal_rate': '{:.2f}%'.format(result.marginal_rate[i] * 100),
+            'refund_or_owe': '{:,.2f}'.format(abs(refund_or_owe[i])),
+            'is_refund': bool(refund_or_owe[i] > 0)
+        })
+    
+    # Compare statuses side by side for each adjustment
+    tax_grid = result.tax.reshape(len(statuses), income_adjustments.size, deduction_adjustments.size)
+    best_index = tax_grid.argmin(axis=0)
+    best = []
+    for i, income_adjustment in enumerate(income_adjustments):
+        for j, deduction_adjustment in enumerate(deduction_adjustments):
+            best_status = statuses[best_index[i, j]]
+            best.append({
+                'income_adjustment': '{:,.2f}'.format(income_adjustment),
+                'deduction_adjustment': '{:,.2f}'.format(deduction_adjustment),
+                'tax_status': best_status,
+                'tax': '{:,.2f}'.format(tax_grid[best_index[i, j], i, j])
+            })
+    return scenarios, best
+
+# Duplicate detection within one upload
+PAGE_HASH_SIZE = 32  # Gradient hash grid of the first page
+PAGE_HASH_MAX_DISTANCE = 0.02  # Fraction of hash bits that may differ between copies of a page
+TEXT_SHINGLE_WORDS = 3
+TEXT_MIN_SHINGLES = 20  # Texts with fewer shingles are too short to compare
+TEXT_DUPLICATE_SIMILARITY = 0.6  # Jaccard similarity of shingles for texts to be the same document
+AMOUNT_DUPLICATE_SIMILARITY = 0.8  # Jaccard similarity of the dollar amounts, which tell filled-in forms apart
+DOLLAR_AMOUNT_RE = re.compile(r'\d{1,3}(?:,\d{3})+\.\d{2}|\d+\.\d{2}')
+
+def page_hash(image):
+    """Difference hash of a page image: whether each cell of a PAGE_HASH_SIZE grid is brighter than its right neighbour."""
+    pixels = np.asarray(image.convert('L').resize((PAGE_HASH_SIZE + 1, PAGE_HASH_SIZE), Image.BILINEAR), dtype=np.int16)
+    return pixels[:, 1:] > pixels[:, :-1]
+
+def text_fingerprint(text):
+    """Word shingles and dollar amounts of a document's text, ignoring case, punctuation and layout."""
+    words = re.findall(r'[a-z0-9]+', text.lower())
+    shingles = {' '.join(words[i:i + TEXT_SHINGLE_WORDS]) for i in range(len(words) - TEXT_SHINGLE_WORDS + 1)}
+    amounts = {amount.replace(',', '') for amount in DOLLAR_AMOUNT_RE.findall(text)}
+    return shingles, amounts
+
+def jaccard(a, b):
+    return len(a & b) / len(a | b) if a or b else 0.0
+
+class DuplicateDetector:
+    """Spots documents in one upload that repeat an earlier one.
+    
+    Identical bytes are caught before any extraction. Other copies (a scan
+    saved twice, a PDF and a photo of it) are caught once their text is
+    extracted, before it is added to the totals: the text must match an
+    earlier document's and so must its dollar amounts, as every copy of a
+    form template shares the printed labels.
+    
+    A near-identical first page marks the earlier file as a likely original,
+    and then the dollar amounts alone decide. The page hash is not enough on
+    its own, as two different W-2s on the same template hash closer than a
+    re-encoded copy of either.
+    
+    Files are identified by their index in the upload, as two files can
+    share a name.
+    """
+    
+    def __init__(self):
+        self.digests = {}  # digest -> index
+        self.page_hashes = []  # (index, hash)
+        self.fingerprints = {}  # index -> (shingles, amounts)
+    
+    def check_bytes(self, index, document):
+        """Return the index of the earlier file with identical bytes, or None."""
+        digest = hashlib.sha256(document.view).hexdigest()
+        original = self.digests.get(digest)
+        if original is None:
+            self.digests[digest] = index
+        return original
+    
+    def similar_page(self, index, filename, document, file_ext):
+        """Return the index of the earlier file whose first page looks the same, or None."""
+        try:
+            if file_ext == '.pdf' and PYMUPDF_AVAILABLE:
+                with fitz.open(stream=document.view, filetype='pdf') as doc:
+                    image = render_pdf_page(document.view, 1, OCR_DETECT_DPI, doc)
+            elif file_ext == '.pdf':
+                image = render_pdf_page(document.view, 1, OCR_DETECT_DPI)
+            else:
+                image = Image.open(document.stream())
+                image.draft('L', (PAGE_HASH_SIZE * 8, PAGE_HASH_SIZE * 8))
+            if image is None:
+                return None
+            current = page_hash(image)
+        except Exception as e:
+            logger.warning("Could not hash the first page of %s: %s", filename, e)
+            return None
+        
+        max_distance = PAGE_HASH_MAX_DISTANCE * current.size
+        self.page_hashes.append((index, current))
+        for original, previous in self.page_hashes[:-1]:
+            if np.count_nonzero(current != previous) <= max_distance:
+                return original
+        return None
+    
+    def check_text(self, index, text, similar_to=None):
+        """Return the index of the earlier file with the same text and amounts, or None.
+        
+        similar_to is the index returned by similar_page.
+        """
+        shingles, amounts = text_fingerprint(text)
+        if len(shingles) < TEXT_MIN_SHINGLES or not amounts:
+            return None
+        for original, (previous_shingles, previous_amounts) in self.fingerprints.items():
+            if jaccard(amounts, previous_amounts) < AMOUNT_DUPLICATE_SIMILARITY:
+                continue
+            if original == similar_to or jaccard(shingles, previous_shingles) >= TEXT_DUPLICATE_SIMILARITY:
+                return original
+        self.fingerprints[index] = (shingles, amounts)
+        return None
+
+def submit_bounded(fn, items, limit):
+    """Yield a Future of fn(item) per item, in order, with at most limit running at once on file_executor.
+    
+    A limit of 1 runs each item in the calling thread when its Future is
+    reached, without using the executor.
+    """
+    pending = deque()
+    for item in items:
+        if limit <= 1:
+            future = Future()
+            try:
+                future.set_result(fn(item))
+            except Exception as e:
+                future.set_exception(e)
+            yield future
+            continue
+        pending.append(file_executor.submit(fn, item))
+        if len(pending) >= limit:
+            yield pending.popleft()
+    while pending:
+        yield pending.popleft()
+
+OCR_PAGE_METHODS = ('easyocr', 'tesseract')  # Page methods that read a rendered image
+
+def extract_document_text(filename, document, file_ext, report):
+    """Extract the text of one document, from the extraction cache when possible.
+    
+    Returns (text, engine), where engine names how the text was obtained:
+    'image_ocr', or the page methods of a PDF ('text', 'easyocr', ...). A
+    cached document reports the engine that originally extracted it.
+    """
+    # Skip OCR entirely if we have already extracted this exact document
+    cache_key = None
+    cached = None
+    if extraction_cache.enabled:
+        cache_key = extraction_cache.make_key(document.view, file_ext.lstrip('.'))
+        cached = extraction_cache.get(cache_key)
+    
+    if cached is not None:
+        logger.info("Using cached extraction for %s", filename)
+        report('extracted', file=filename, method='cache', engine=cached['engine'])
+        return cached['text'], cached['engine']
+    
+    page_texts = {}
+    page_reads = []  # (method, chars) of every page read, including reads a fallback replaced
+    
+    def page_progress(event, **fields):
+        if event == 'page':
+            page_reads.append((fields['method'], fields['chars']))
+        report(event, file=filename, **fields)
+    
+    if file_ext == '.pdf':
+        extracted_text = process_pdf(document.view, page_progress, page_texts)
+        engine = '+'.join(sorted({method for method, _ in page_reads})) or 'pdf'
+        report('extracted', file=filename, method='pdf')
+    else:
+        image = Image.open(document.stream())
+        extracted_text = process_image(image, page_progress)
+        engine = 'image_ocr'
+        page_texts[1] = extracted_text
+        report('extracted', file=filename, method='image_ocr')
+    
+    # Text from a fallback or with empty OCR pages may come from a transient EasyOCR failure
+    # (a checkout timeout, a failed batch), so it is not cached as the document's result
+    degraded = any(method in OCR_PAGE_METHODS and not chars for method, chars in page_reads) or \
+               (ocr_engines.available and any(method == 'tesseract' for method, _ in page_reads))
+    if degraded:
+        record_stat('extraction_cache_skipped_degraded')
+    if cache_key and extracted_text and not degraded and not extracted_text.startswith(("ERROR:", "OCR ERROR:")):
+        extraction_cache.put(cache_key, extracted_text, page_texts, engine)
+    return extracted_text, engine
+
+def process_tax_documents(files, tax_status, tax_year=None, progress=None):
+    """Process a list of tax documents and return tax information.
+    
+    progress, if given, is called as progress(event, **fields) as each file
+    and page is processed, for streaming to the client.
+    """
+    logger.info("Starting to process %d tax documents with tax status: %s", len(files), tax_status)
     
     # Validate tax status
     if tax_status not in VALID_TAX_STATUSES:
@@ -905,51 +2397,124 @@ def process_tax_documents(files, tax_status):
         logger.error(error_msg)
         return {'error': error_msg}
     
-    tax_doc = TaxDocument()
-    warnings = []
+    # Validate tax year
+    try:
+        tax_year = get_tax_year(tax_year).year
+    except ValueError as e:
+        logger.error(str(e))
+        return {'error': str(e)}
+    
+    records = []  # One DocumentRecord per processed file, in upload order
+    running_totals = TaxDocument()  # For progress events only
+    file_warnings = [[] for _ in files]  # Kept per file so warnings read in upload order
+    
+    duplicates = DuplicateDetector() if app.config['DUPLICATE_DETECTION'] else None
+    
+    def report(event, **fields):
+        if progress is not None:
+            progress(event, **fields)
+    
+    def warn(index, warning_msg):
+        logger.warning(warning_msg)
+        file_warnings[index].append(warning_msg)
+    
+    def skip_duplicate(index, filename, original, check):
+        """Drop a file that repeats the file at index original."""
+        original_name = secure_filename(files[original].filename)
+        warn(index, f"Skipping {filename}: duplicate of {original_name} (file {original + 1})")
+        record_stat(f'duplicate_documents_{check}')
+        report('duplicate', file=filename, original=original_name, original_index=original + 1, check=check)
+    
+    def file_error(index, file, e):
+        error_msg = f"Error processing {file.filename}: {str(e)}"
+        logger.error(error_msg)
+        logger.error(traceback.format_exc())
+        file_warnings[index].append(error_msg)
+        report('file_error', file=file.filename, error=str(e))
     
-    # Process each file and extract text
-    for file in files:
+    # Files are screened in upload order, extracted concurrently, then merged back in upload order,
+    # so the results are the same as processing them one after another
+    tasks = []  # (index, filename, document, file_ext, similar_to) of the files to extract
+    for index, file in enumerate(files):
         try:
             filename = secure_filename(file.filename)
-            logger.info(f"Processing file: {filename}")
-            
             file_ext = os.path.splitext(filename)[1].lower()
             
-            if file_ext == '.pdf':
-                extracted_text = process_pdf(file)
-            elif file_ext in ['.jpg', '.jpeg', '.png']:
-                image = Image.open(file)
-                extracted_text = process_image(image)
-            else:
-                warning_msg = f"Skipping unsupported file: {filename}"
-                logger.warning(warning_msg)
-                warnings.append(warning_msg)
+            if file_ext not in ['.pdf', '.jpg', '.jpeg', '.png']:
+                warn(index, f"Skipping unsupported file: {filename}")
                 continue
-                
-            if extracted_text and extracted_text.startswith("ERROR:"):
-                warning_msg = f"Failed to extract text from {filename}: {extracted_text}"
-                logger.warning(warning_msg)
-                warnings.append(warning_msg)
+            
+            document = as_uploaded_document(file)
+            
+            # Repeats of an earlier file are dropped so their amounts are not counted twice;
+            # an identical file is dropped before it is extracted at all
+            similar_to = None
+            if duplicates is not None:
+                original = duplicates.check_bytes(index, document)
+                if original is not None:
+                    skip_duplicate(index, filename, original, 'bytes')
+                    continue
+                similar_to = duplicates.similar_page(index, filename, document, file_ext)
+            
+            tasks.append((index, filename, document, file_ext, similar_to))
+        except Exception as e:
+            file_error(index, file, e)
+    
+    def extract(task):
+        """Extract one file's text and record. Runs on file_executor."""
+        index, filename, document, file_ext, _ = task
+        logger.info("Processing file: %s", filename)
+        report('file', file=filename, index=index + 1, total=len(files))
+        
+        start_extraction = time.perf_counter()
+        extracted_text, engine = extract_document_text(filename, document, file_ext, report)
+        extraction_time = time.perf_counter() - start_extraction
+        if extracted_text and extracted_text.startswith("ERROR:"):
+            return extracted_text, None
+        
+        # Process the extracted text to get tax information
+        start_regex = time.perf_counter()
+        record = DocumentRecord.from_text(filename, extracted_text, engine, {'extraction': extraction_time})
+        record_timing('regex_extraction', time.perf_counter() - start_regex)
+        return extracted_text, record
+    
+    concurrency = min(app.config['UPLOAD_CONCURRENCY'], len(tasks))
+    for task, future in zip(tasks, submit_bounded(extract, tasks, concurrency)):
+        index, filename, _, _, similar_to = task
+        try:
+            extracted_text, record = future.result()
+            
+            if record is None:
+                warn(index, f"Failed to extract text from {filename}: {extracted_text}")
+                report('file_error', file=filename, error="Could not extract text")
                 continue
-                
-            # Process the extracted text to get tax information
-            previous_wages = tax_doc.income['wages']
-            tax_doc.process_text(extracted_text)
+            
+            if duplicates is not None and extracted_text:
+                original = duplicates.check_text(index, extracted_text, similar_to)
+                if original is not None:
+                    skip_duplicate(index, filename, original, 'page' if original == similar_to else 'text')
+                    continue
+            
+            records.append(record)
             
             # Check if we found wages in this document
-            if tax_doc.income['wages'] == previous_wages:
-                warning_msg = f"No wage information found in {filename}"
-                logger.warning(warning_msg)
-                warnings.append(warning_msg)
+            if not record.income['wages']:
+                warn(index, f"No wage information found in {filename}")
             
+            # Running totals so far, before deductions and tax are worked out at the end
+            running_totals.add_record(record)
+            report('document', file=filename, document_type=record.document_type,
+                   income={k: '{:,.2f}'.format(v) for k, v in running_totals.income.items()},
+                   total_income='{:,.2f}'.format(sum(running_totals.income.values())),
+                   tax_paid='{:,.2f}'.format(running_totals.tax_paid))
         except Exception as e:
-            error_msg = f"Error processing {file.filename}: {str(e)}"
-            logger.error(error_msg)
-            logger.error(traceback.format_exc())
-            warnings.append(error_msg)
+            file_error(index, files[index], e)
+    
+    warnings = [warning for file_warning in file_warnings for warning in file_warning]
     
     # Calculate totals
+    tax_doc = combine_records(records)
+    start_tax = time.perf_counter()
     total_income = sum(tax_doc.income.values())
     total_deductions = sum(tax_doc.deductions.values())
     taxable_income = max(0, total_income - total_deductions)
@@ -961,20 +2526,20 @@ def process_tax_documents(files, tax_status):
         warnings.append(warning_msg)
     
     # Calculate tax based on filing status
-    tax = calculate_tax(taxable_income, tax_status)
+    tax = calculate_tax(taxable_income, tax_status, tax_year)
     
     # Calculate tax rate for display
     tax_rate = 0 if taxable_income == 0 else (tax / taxable_income) * 100
     
     # Get standard deduction for comparison
-    standard_deduction = get_standard_deduction(tax_status)
+    standard_deduction = get_standard_deduction(tax_status, tax_year)
     
     # Determine if standard deduction is better
     use_standard_deduction = total_deductions < standard_deduction
     
     if use_standard_deduction:
         taxable_income = max(0, total_income - standard_deduction)
-        tax = calculate_tax(taxable_income, tax_status)
+        tax = calculate_tax(taxable_income, tax_status, tax_year)
         tax_rate = 0 if taxable_income == 0 else (tax / taxable_income) * 100
         
         warning_msg = f"Standard deduction (${standard_deduction:,.2f}) is higher than itemized deductions (${total_deductions:,.2f}). Using standard deduction."
@@ -984,6 +2549,7 @@ def process_tax_documents(files, tax_status):
     # Calculate refund or amount due
     tax_paid = tax_doc.tax_paid
     refund_or_owe = tax_paid - tax
+    record_timing('tax_calculation', time.perf_counter() - start_tax)
     
     # If no income was found, add a warning
     if total_income == 0:
@@ -1004,12 +2570,15 @@ def process_tax_documents(files, tax_status):
         'refund_or_owe': '{:,.2f}'.format(abs(refund_or_owe)),
         'is_refund': refund_or_owe > 0,
         'individuals': tax_doc.individuals,
+        'documents': [record.to_dict() for record in records],
         'tax_status': VALID_TAX_STATUSES.get(tax_status, tax_status),
+        'tax_year': tax_year,
         'warnings': warnings if warnings else None
     }
     
-    logger.info(f"Processed {len(files)} documents. Found {len(tax_doc.individuals)} individuals.")
-    logger.info(f"Total income: ${total_income:,.2f}, Tax: ${tax:,.2f}, {'Refund' if refund_or_owe > 0 else 'Amount Due'}: ${abs(refund_or_owe):,.2f}")
+    logger.info("Processed %d documents. Found %d individuals.", len(files), len(tax_doc.individuals))
+    logger.info("Total income: $%.2f, Tax: $%.2f, %s: $%.2f", total_income, tax,
+                'Refund' if refund_or_owe > 0 else 'Amount Due', abs(refund_or_owe))
     
     return result
 
@@ -1021,6 +2590,102 @@ VALID_TAX_STATUSES = {
     'head_household': 'Head of Household'
 }
 
+# Background job queue for document processing
+job_executor = ThreadPoolExecutor(max_workers=app.config['JOB_WORKERS'], thread_name_prefix='tax-job')
+# Files of all uploads share these workers; each upload uses at most UPLOAD_CONCURRENCY of them
+file_executor = ThreadPoolExecutor(max_workers=app.config['FILE_WORKERS'], thread_name_prefix='tax-file')
+jobs = {}
+jobs_lock = threading.Lock()
+jobs_changed = threading.Condition(jobs_lock)  # Notified when a job records a progress event
+JOB_EVENTS_HEARTBEAT_SECONDS = 15  # Keeps idle event streams open through proxies
+
+def publish_job_event(job_id, event, **fields):
+    """Record a progress event for a job and wake any clients streaming its events."""
+    with jobs_changed:
+        job = jobs.get(job_id)
+        if job is None:
+            return
+        job['events'].append({'event': event, **fields, 'time': round(time.time(), 3)})
+        jobs_changed.notify_all()
+
+def prune_jobs():
+    """Drop finished jobs older than the retention window. Caller must hold jobs_lock."""
+    cutoff = time.time() - app.config['JOB_RETENTION_SECONDS']
+    expired = [job_id for job_id, job in jobs.items()
+               if job['finished_at'] is not None and job['finished_at'] < cutoff]
+    for job_id in expired:
+        del jobs[job_id]
+
+def run_job(job_id, files, tax_status, tax_year, file_names):
+    """Run process_tax_documents for a queued job and store the result."""
+    with jobs_lock:
+        jobs[job_id]['status'] = 'running'
+        jobs[job_id]['started_at'] = time.time()
+    publish_job_event(job_id, 'running')
+    
+    try:
+        result = process_tax_documents(files, tax_status, tax_year,
+                                       lambda event, **fields: publish_job_event(job_id, event, **fields))
+        result['file_names'] = file_names
+        status = 'failed' if 'error' in result else 'completed'
+    except Exception as e:
+        logger.error("Error in job %s: %s", job_id, e)
+        logger.error(traceback.format_exc())
+        result = {'error': f"Processing error: {str(e)}"}
+        status = 'failed'
+    
+    with jobs_lock:
+        job = jobs[job_id]
+        job['status'] = status
+        job['result'] = result
+        job['finished_at'] = time.time()
+        logger.info("Job %s %s in %.2f seconds", job_id, status, job['finished_at'] - job['started_at'])
+        # Recorded under the same lock as finished_at, so a stream never ends without it
+        job['events'].append({'event': status, 'time': round(job['finished_at'], 3),
+                              'result_url': f'/jobs/{job_id}/result'})
+        jobs_changed.notify_all()
+    record_timing('job', job['finished_at'] - job['started_at'])
+    record_stat(f'jobs_{status}')
+
+def submit_job(files, tax_status, tax_year, file_names):
+    """Queue a processing job. Returns the job ID, or None if the queue is full."""
+    with jobs_lock:
+        prune_jobs()
+        pending = sum(1 for job in jobs.values() if job['status'] in ('queued', 'running'))
+        if pending >= app.config['MAX_PENDING_JOBS']:
+            return None
+        
+        job_id = uuid.uuid4().hex
+        jobs[job_id] = {
+            'status': 'queued',
+            'tax_status': tax_status,
+            'tax_year': tax_year,
+            'file_names': file_names,
+            'created_at': time.time(),
+            'started_at': None,
+            'finished_at': None,
+            'result': None,
+            'events': [{'event': 'queued', 'time': round(time.time(), 3)}]
+        }
+    
+    job_executor.submit(run_job, job_id, files, tax_status, tax_year, file_names)
+    logger.info("Queued job %s with %d files (%d pending)", job_id, len(files), pending + 1)
+    return job_id
+
+def job_status(job_id, job):
+    """Build the public status view of a job."""
+    status = {
+        'job_id': job_id,
+        'status': job['status'],
+        'file_names': job['file_names'],
+        'created_at': job['created_at'],
+        'started_at': job['started_at'],
+        'finished_at': job['finished_at']
+    }
+    if job['status'] == 'failed' and job['result']:
+        status['error'] = job['result'].get('error')
+    return status
+
 @app.route('/')
 def index():
     return render_template('index.html')
@@ -1040,7 +2705,8 @@ def upload_file():
     
     # Get tax status from form
     tax_status = request.form.get('tax_status', 'single')
-    app.logger.info(f"Processing files with tax status: {tax_status}")
+    tax_year = request.form.get('tax_year')
+    app.logger.info("Processing files with tax status: %s", tax_status)
     
     # List to store valid files
     valid_files = []
@@ -1050,68 +2716,242 @@ def upload_file():
         for file in files:
             filename = secure_filename(file.filename)
             file_names.append(filename)
-            app.logger.info(f"Processing file: {filename}")
+            app.logger.info("Processing file: %s", filename)
             
-            # Check file size (limit to 10MB)
-            file.seek(0, os.SEEK_END)
-            file_size = file.tell()
-            app.logger.info(f"File size: {file_size} bytes")
-            if file_size > 10 * 1024 * 1024:  # 10MB
-                app.logger.error(f"File {filename} exceeds size limit")
+            # Read the upload once; the job works on this buffer after the request ends
+            document = read_upload(file)
+            if document is None:
+                app.logger.error("File %s exceeds size limit", filename)
                 return jsonify({'error': f'File {filename} is too large (max 10MB)'})
-            file.seek(0)
+            app.logger.info("File size: %d bytes", document.size)
             
             # Check file type
             if MAGIC_AVAILABLE:
                 # Use python-magic for precise file type detection
-                file_bytes = file.read()
-                mime_type = magic.from_buffer(file_bytes, mime=True)
-                file.seek(0)  # Reset file pointer after reading
-                app.logger.info(f"Detected MIME type: {mime_type}")
+                mime_type = sniff_mime_type(document)
+                app.logger.info("Detected MIME type: %s", mime_type)
                 
-                if not (mime_type.startswith('application/pdf') or 
-                        mime_type.startswith('image/jpeg') or 
-                        mime_type.startswith('image/png')):
-                    app.logger.error(f"Invalid file type for {filename}: {mime_type}")
+                if not mime_type.startswith(ALLOWED_MIME_TYPES):
+                    app.logger.error("Invalid file type for %s: %s", filename, mime_type)
                     return jsonify({'error': f'Invalid file type for {filename}. Allowed types: PDF, JPG, PNG'})
             else:
                 # Fallback to extension checking
                 _, ext = os.path.splitext(filename)
                 ext = ext.lower()
-                app.logger.info(f"File extension: {ext}")
+                app.logger.info("File extension: %s", ext)
                 if ext not in ['.pdf', '.jpg', '.jpeg', '.png']:
-                    app.logger.error(f"Invalid file extension for {filename}: {ext}")
+                    app.logger.error("Invalid file extension for %s: %s", filename, ext)
                     return jsonify({'error': f'Invalid file extension for {filename}. Allowed types: PDF, JPG, PNG'})
             
-            valid_files.append(file)
+            valid_files.append(document)
         
-        # Process the valid tax documents
-        app.logger.info(f"Beginning tax document processing with {len(valid_files)} files")
-        result = process_tax_documents(valid_files, tax_status)
-        
-        # Add file names to response for logging/display
-        result['file_names'] = file_names
+        # Queue the valid tax documents for background processing
+        job_id = submit_job(valid_files, tax_status, tax_year, file_names)
+        if job_id is None:
+            app.logger.error("Job queue is full, rejecting upload")
+            return jsonify({'error': 'Server is busy processing other documents. Please try again shortly.'}), 503
         
-        app.logger.info(f"Document processing complete. Returning results.")
-        return jsonify(result)
+        app.logger.info("Queued job %s with %d files", job_id, len(valid_files))
+        return jsonify({
+            'job_id': job_id,
+            'status': 'queued',
+            'status_url': f'/jobs/{job_id}',
+            'result_url': f'/jobs/{job_id}/result',
+            'events_url': f'/jobs/{job_id}/events'
+        }), 202
     except Exception as e:
-        app.logger.error(f"Error in upload_file: {str(e)}")
+        app.logger.error("Error in upload_file: %s", e)
         app.logger.error(traceback.format_exc())
         return jsonify({'error': f"Processing error: {str(e)}"})
 
-if __name__ == "__main__":
-    # Configure logging to write to a file
-    logging.basicConfig(
-        level=logging.INFO,
-        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-        handlers=[
-            logging.FileHandler("logs/app.log"),
-            logging.StreamHandler()
-        ]
-    )
+@app.route('/scenarios', methods=['POST'])
+def scenarios():
+    data = request.get_json(silent=True) or {}
+    
+    # Totals come from a finished job or directly from an earlier /upload result
+    if 'job_id' in data:
+        if not isinstance(data['job_id'], str):
+            return jsonify({'error': 'Invalid scenario input: job_id must be a string'}), 400
+        with jobs_lock:
+            job = jobs.get(data['job_id'])
+            job_result = job['result'] if job is not None else None
+        if not job_result or 'error' in job_result:
+            return jsonify({'error': f"No completed results for job: {data['job_id']}"}), 404
+        data = dict(job_result, **{k: v for k, v in data.items() if k != 'job_id'})
+    
+    try:
+        if 'total_income' in data:
+            total_income = parse_amount(data['total_income'])
+        else:
+            total_income = sum(parse_amount(v) for v in data.get('income', {}).values())
+        if 'deductions' in data:
+            itemized_deductions = sum(parse_amount(v) for v in data['deductions'].values())
+        else:
+            itemized_deductions = parse_amount(data.get('itemized_deductions', 0))
+        tax_paid = parse_amount(data.get('tax_paid', 0))
+        income_adjustments = parse_amount_list(data, 'income_adjustments')
+        deduction_adjustments = parse_amount_list(data, 'deduction_adjustments')
+    except (TypeError, ValueError, AttributeError) as e:
+        return jsonify({'error': f'Invalid scenario input: {str(e)}'}), 400
+    
+    try:
+        tax_year = get_tax_year(data.get('tax_year')).year
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    statuses = data.get('statuses') or list(VALID_TAX_STATUSES)
+    if not isinstance(statuses, list):
+        return jsonify({'error': 'Invalid scenario input: statuses must be a list of tax statuses'}), 400
+    invalid = [status for status in statuses if not isinstance(status, str) or status not in VALID_TAX_STATUSES]
+    if invalid:
+        valid_statuses = ', '.join(VALID_TAX_STATUSES.keys())
+        return jsonify({'error': f'Invalid tax status: "{invalid[0]}". Must be one of: {valid_statuses}'}), 400
+    
+    count = len(statuses) * len(income_adjustments) * len(deduction_adjustments)
+    if count > MAX_SCENARIOS:
+        return jsonify({'error': f'Too many scenarios ({count}). Maximum is {MAX_SCENARIOS}.'}), 400
+    
+    start_time = time.time()
+    results, best = evaluate_scenarios(total_income, itemized_deductions, tax_paid, statuses,
+                                       income_adjustments, deduction_adjustments, tax_year)
+    logger.info("Evaluated %d tax scenarios in %.2f ms", count, (time.time() - start_time) * 1000)
+    
+    return jsonify({'scenarios': results, 'best': best, 'count': count, 'tax_year': tax_year})
+
+@app.route('/ready')
+def readiness():
+    status = ocr_engines.status()
+    # Lazy loading accepts requests before the model is loaded; the first one loads it
+    ready = status['state'] in ('ready', 'unavailable', 'failed') or \
+            (status['state'] == 'not_loaded' and app.config['EASYOCR_LOAD'] == 'lazy')
+    return jsonify({'ready': ready, 'ocr': status}), 200 if ready else 503
+
+@app.route('/diagnostics')
+def diagnostics():
+    refresh = request.args.get('refresh', '').lower() in ('1', 'true', 'yes')
+    return jsonify({
+        'engines': get_engine_capabilities(refresh=refresh),
+        'ocr': ocr_engines.status()
+    })
+
+@app.route('/stats')
+def get_stats():
+    with pipeline_stats_lock:
+        stats = dict(pipeline_stats)
+    ocr_documents = stats.get('pdf_ocr_documents', 0)
+    stats['pdf_tesseract_fallback_rate'] = stats.get('pdf_tesseract_fallbacks', 0) / ocr_documents if ocr_documents else 0
+    return jsonify(stats)
+
+def format_metrics():
+    """Render the pipeline counters and stage histograms in the Prometheus text format."""
+    with pipeline_stats_lock:
+        stats = dict(pipeline_stats)
+        timings = {stage: {'buckets': list(h['buckets']), 'sum': h['sum'], 'count': h['count']}
+                   for stage, h in stage_timings.items()}
+    
+    lines = [
+        '# HELP taxplanning_stage_seconds Time spent in each stage of the extraction pipeline.',
+        '# TYPE taxplanning_stage_seconds histogram'
+    ]
+    for stage in sorted(timings):
+        histogram = timings[stage]
+        cumulative = 0
+        for bound, count in zip(STAGE_BUCKETS, histogram['buckets']):
+            cumulative += count
+            lines.append(f'taxplanning_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+        lines.append(f'taxplanning_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {histogram["count"]}')
+        lines.append(f'taxplanning_stage_seconds_sum{{stage="{stage}"}} {histogram["sum"]:.6f}')
+        lines.append(f'taxplanning_stage_seconds_count{{stage="{stage}"}} {histogram["count"]}')
+    
+    lines.append('# HELP taxplanning_pipeline_events_total Pipeline events such as rendered pages, jobs and engine fallbacks.')
+    lines.append('# TYPE taxplanning_pipeline_events_total counter')
+    for name in sorted(stats):
+        lines.append(f'taxplanning_pipeline_events_total{{event="{name}"}} {stats[name]}')
     
-    # Set logger for this module
-    logger = logging.getLogger(__name__)
+    lines.append('# HELP taxplanning_extraction_cache_requests_total Extraction cache lookups by result.')
+    lines.append('# TYPE taxplanning_extraction_cache_requests_total counter')
+    lines.append(f'taxplanning_extraction_cache_requests_total{{result="hit"}} {extraction_cache.hits}')
+    lines.append(f'taxplanning_extraction_cache_requests_total{{result="miss"}} {extraction_cache.misses}')
+    
+    with jobs_lock:
+        job_counts = Counter(job['status'] for job in jobs.values())
+    lines.append('# HELP taxplanning_jobs Jobs currently held, by status.')
+    lines.append('# TYPE taxplanning_jobs gauge')
+    for status in ('queued', 'running', 'completed', 'failed'):
+        lines.append(f'taxplanning_jobs{{status="{status}"}} {job_counts[status]}')
+    
+    return '\n'.join(lines) + '\n'
+
+@app.route('/metrics')
+def get_metrics():
+    return Response(format_metrics(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/jobs/<job_id>')
+def get_job(job_id):
+    with jobs_lock:
+        job = jobs.get(job_id)
+        if job is None:
+            return jsonify({'error': f'Unknown job: {job_id}'}), 404
+        return jsonify(job_status(job_id, job))
+
+@app.route('/jobs/<job_id>/result')
+def get_job_result(job_id):
+    with jobs_lock:
+        job = jobs.get(job_id)
+        if job is None:
+            return jsonify({'error': f'Unknown job: {job_id}'}), 404
+        if job['status'] in ('queued', 'running'):
+            return jsonify(job_status(job_id, job)), 202
+        return jsonify(job['result'])
+
+@app.route('/jobs/<job_id>/events')
+def get_job_events(job_id):
+    """Stream a job's progress events as server-sent events, or as NDJSON with ?format=ndjson.
+    
+    Events already recorded are replayed first (after Last-Event-ID for a
+    reconnecting EventSource); the stream ends once the job has finished.
+    """
+    with jobs_lock:
+        if job_id not in jobs:
+            return jsonify({'error': f'Unknown job: {job_id}'}), 404
+    
+    ndjson = request.args.get('format') == 'ndjson'
+    try:
+        start = int(request.headers.get('Last-Event-ID', -1)) + 1
+    except ValueError:
+        start = 0
+    
+    def generate():
+        index = start
+        while True:
+            with jobs_changed:
+                job = jobs.get(job_id)
+                if job is not None and index >= len(job['events']) and job['finished_at'] is None:
+                    jobs_changed.wait(JOB_EVENTS_HEARTBEAT_SECONDS)
+                    job = jobs.get(job_id)
+                if job is None:
+                    return
+                events = job['events'][index:]
+                finished = job['finished_at'] is not None
+            
+            if not events and not finished:
+                yield '\n' if ndjson else ': heartbeat\n\n'
+            for event in events:
+                if ndjson:
+                    yield json.dumps(event) + '\n'
+                else:
+                    yield f"id: {index}\nevent: {event['event']}\ndata: {json.dumps(event)}\n\n"
+                index += 1
+            if finished:
+                return
+    
+    mimetype = 'application/x-ndjson' if ndjson else 'text/event-stream'
+    return Response(generate(), mimetype=mimetype,
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+if __name__ == "__main__":
+    # Also write logs to a file
+    configure_logging(log_file="logs/app.log")
     
     # Get port from environment variable or use default
     port = int(os.environ.get('PORT', 54321))
@@ -0,0 +1,199 @@
+"""Headless batch processing of tax documents.
+
+Processes a directory or manifest of documents grouped by household and
+writes one JSON line per household. Households already present in the
+output file are skipped, so an interrupted run can be resumed by running
+the same command again. Households that failed are retried on resume and
+get a new line; the last line for a household is its current result.
+
+Examples:
+    python batch.py clients/ --output results.jsonl --workers 4
+    python batch.py --manifest manifest.json --output results.jsonl
+
+In a directory, each subdirectory is a household and each file at the top
+level is processed as its own household. A manifest is a JSON list of
+{"household": ..., "files": [...], "tax_status": ..., "tax_year": ...}
+entries, with file paths relative to the manifest.
+"""
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from app import process_tax_documents, allowed_file, UploadedDocument, VALID_TAX_STATUSES
+
+logger = logging.getLogger('batch')
+
+def households_from_directory(directory, tax_status, tax_year):
+    """Group the documents in a directory into households."""
+    households = []
+    for name in sorted(os.listdir(directory)):
+        path = os.path.join(directory, name)
+        if os.path.isdir(path):
+            files = [os.path.join(path, f) for f in sorted(os.listdir(path)) if allowed_file(f)]
+            if files:
+                households.append({'household': name, 'files': files, 'tax_status': tax_status, 'tax_year': tax_year})
+        elif allowed_file(name):
+            households.append({'household': name, 'files': [path], 'tax_status': tax_status, 'tax_year': tax_year})
+    return households
+
+def households_from_manifest(manifest_path, tax_status, tax_year):
+    """Read households from a JSON manifest."""
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        entries = json.load(f)
+
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    households = []
+    for entry in entries:
+        households.append({
+            'household': str(entry['household']),
+            'files': [os.path.join(base_dir, path) for path in entry['files']],
+            'tax_status': entry.get('tax_status', tax_status),
+            'tax_year': entry.get('tax_year', tax_year)
+        })
+    return households
+
+def load_checkpoint(output_path):
+    """Return the households already written successfully to the output file.
+    
+    Households recorded with an error are left out so they are retried.
+    """
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # A partial last line from a crash; the household will be redone
+                continue
+            if record.get('status') == 'ok' and 'household' in record:
+                done.add(record['household'])
+    return done
+
+def truncate_partial_line(output_path):
+    """Drop a partial last line left by a crash, so the next record starts on its own line."""
+    if not os.path.exists(output_path):
+        return
+    with open(output_path, 'rb+') as f:
+        size = f.seek(0, os.SEEK_END)
+        if size == 0:
+            return
+        # Scan back from the end for the last newline
+        position = size
+        while position > 0:
+            chunk_start = max(0, position - 65536)
+            f.seek(chunk_start)
+            chunk = f.read(position - chunk_start)
+            newline = chunk.rfind(b'\n')
+            if newline != -1:
+                end = chunk_start + newline + 1
+                break
+            position = chunk_start
+        else:
+            end = 0
+        if end < size:
+            logger.warning("Removing a partial last line (%s bytes) from %s", size - end, output_path)
+            f.truncate(end)
+
+def process_household(household):
+    """Process one household's documents. Returns the JSON record to write."""
+    start_time = time.time()
+    record = {
+        'household': household['household'],
+        'files': [os.path.basename(path) for path in household['files']],
+        'tax_status': household['tax_status']
+    }
+
+    try:
+        files = []
+        for path in household['files']:
+            with open(path, 'rb') as f:
+                files.append(UploadedDocument(os.path.basename(path), f.read()))
+
+        result = process_tax_documents(files, household['tax_status'], household['tax_year'])
+        record['status'] = 'error' if 'error' in result else 'ok'
+        record['result'] = result
+    except Exception as e:
+        logger.error("Error processing household %s: %s", household['household'], e)
+        record['status'] = 'error'
+        record['result'] = {'error': str(e)}
+
+    record['seconds'] = round(time.time() - start_time, 3)
+    return record
+
+def run_batch(households, output_path, workers):
+    """Process households concurrently, appending each result to the output file as it finishes."""
+    truncate_partial_line(output_path)
+    done = load_checkpoint(output_path)
+    pending = [household for household in households if household['household'] not in done]
+    if done:
+        logger.info("Resuming: skipping %d households already in %s", len(households) - len(pending), output_path)
+
+    total_documents = sum(len(household['files']) for household in pending)
+    logger.info("Processing %d households (%d documents) with %d workers", len(pending), total_documents, workers)
+
+    write_lock = threading.Lock()
+    processed_documents = 0
+    errors = 0
+    start_time = time.time()
+
+    with open(output_path, 'a', encoding='utf-8') as output, ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(process_household, household): household for household in pending}
+        for future in as_completed(futures):
+            record = future.result()
+            with write_lock:
+                output.write(json.dumps(record) + '\n')
+                # Make the checkpoint durable before counting the household as done
+                output.flush()
+                os.fsync(output.fileno())
+
+            processed_documents += len(record['files'])
+            errors += record['status'] != 'ok'
+            elapsed_minutes = (time.time() - start_time) / 60
+            rate = processed_documents / elapsed_minutes if elapsed_minutes > 0 else 0
+            logger.info("[%d/%d documents] %s: %s in %.2f seconds (%.1f documents/minute)",
+                        processed_documents, total_documents, record['household'], record['status'],
+                        record['seconds'], rate)
+
+    elapsed = time.time() - start_time
+    rate = processed_documents / (elapsed / 60) if elapsed > 0 else 0
+    logger.info("Processed %d documents in %d households in %.2f seconds (%.1f documents/minute, %d households with errors)",
+                processed_documents, len(pending), elapsed, rate, errors)
+    return errors
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Batch process tax documents grouped by household.')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('directory', nargs='?', help='Directory of documents; each subdirectory is a household')
+    source.add_argument('--manifest', help='JSON manifest of households and their files')
+    parser.add_argument('--output', required=True, help='JSON Lines output file, also used as the resume checkpoint')
+    parser.add_argument('--workers', type=int, default=2, help='Households processed concurrently (default 2)')
+    parser.add_argument('--tax-status', default='single', choices=list(VALID_TAX_STATUSES),
+                        help='Filing status for households that do not specify one (default single)')
+    parser.add_argument('--tax-year', type=int, help='Tax year for households that do not specify one')
+    parser.add_argument('--log-level', default='INFO', help='Log level for document processing (default INFO)')
+    args = parser.parse_args(argv)
+
+    # app configures root logging on import; only its own verbosity is adjustable here
+    logging.getLogger('app').setLevel(args.log_level.upper())
+
+    if args.manifest:
+        households = households_from_manifest(args.manifest, args.tax_status, args.tax_year)
+    else:
+        households = households_from_directory(args.directory, args.tax_status, args.tax_year)
+
+    if not households:
+        logger.error("No documents found")
+        return 1
+
+    errors = run_batch(households, args.output, max(1, args.workers))
+    return 1 if errors else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,488 @@
+"""End-to-end benchmark of the document pipeline on synthetic tax forms.
+
+Generates W-2, 1099-INT/DIV/MISC/NEC/R, 1098 and K-1 documents with known values,
+as digital PDFs (text layer), scanned PDFs (image only) and single images,
+at several page counts and noise levels. Each document is run through
+process_pdf or process_image and then TaxDocument.process_text, and the
+report records per-stage latency, peak memory, throughput and extraction
+accuracy. Pipeline stages (rasterizing, OCR, text extraction) are broken out
+from the app's stage timings.
+
+Examples:
+    python benchmark.py --output benchmarks/baseline.json
+    python benchmark.py --compare benchmarks/baseline.json --output benchmarks/latest.json
+
+With --compare, the run exits with status 1 if a case got slower or used more
+memory than the tolerance allows, or extracted fewer fields correctly than the
+baseline. Memory is the growth of process RSS while a case runs, so it covers
+image and OCR buffers outside the Python heap.
+Generating documents requires PyMuPDF. Scanned and image cases need an OCR
+engine and are skipped when none is available.
+"""
+import io
+import os
+import sys
+import json
+import time
+import random
+import logging
+import argparse
+import ctypes
+import platform
+import threading
+import statistics
+import numpy as np
+from PIL import Image
+
+from app import (process_pdf, process_image, TaxDocument, get_engine_capabilities, PYMUPDF_AVAILABLE,
+                 stage_timings, pipeline_stats_lock)
+
+if PYMUPDF_AVAILABLE:
+    import fitz
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+try:
+    malloc_trim = ctypes.CDLL('libc.so.6').malloc_trim
+except (OSError, AttributeError):
+    malloc_trim = None
+
+logger = logging.getLogger('benchmark')
+
+BENCHMARK_VERSION = 2
+SCAN_DPI = 200  # Resolution of the synthetic scans
+RSS_SAMPLE_SECONDS = 0.002  # How often process memory is sampled during the memory run
+MEMORY_SLACK_KB = 1024  # Memory growth below this is noise and never a regression
+KINDS = ('digital', 'scanned', 'image')
+
+# Synthetic form layouts. Values are filled from the ground truth, keyed by the
+# field names TaxDocument reports (income and deduction keys, or tax_paid).
+FORM_TEMPLATES = {
+    'W-2': {
+        'lines': [
+            "Form W-2 Wage and Tax Statement",
+            "Employee's name: Alex Sample",
+            "1 Wages, tips, other compensation {wages}",
+            "2 Federal income tax withheld {tax_paid}",
+        ],
+        'fields': {'wages': (20000, 250000), 'tax_paid': (0.08, 0.25)}
+    },
+    '1099-INT': {
+        'lines': [
+            "Form 1099-INT Interest Income",
+            "Payer: First Sample Bank",
+            "Box 1 Interest income {interest}",
+        ],
+        'fields': {'interest': (50, 20000)}
+    },
+    '1099-DIV': {
+        'lines': [
+            "Form 1099-DIV Dividends and Distributions",
+            "Payer: Sample Brokerage",
+            "Box 1a Ordinary dividends {dividends}",
+        ],
+        'fields': {'dividends': (50, 20000)}
+    },
+    '1099-MISC': {
+        'lines': [
+            "Form 1099-MISC Miscellaneous Income",
+            "Payer: Sample Property Management",
+            "Box 7 Nonemployee compensation {other}",
+        ],
+        'fields': {'other': (500, 100000)}
+    },
+    '1099-NEC': {
+        'lines': [
+            "Form 1099-NEC Nonemployee Compensation",
+            "Payer: Sample Consulting LLC",
+            "Box 1 Nonemployee compensation {other}",
+        ],
+        'fields': {'other': (500, 100000)}
+    },
+    '1099-R': {
+        'lines': [
+            "Form 1099-R Distributions From Pensions, Annuities, Retirement Plans",
+            "Payer: Sample Retirement Trust",
+            "Box 1 Total distribution {other}",
+        ],
+        'fields': {'other': (1000, 80000)}
+    },
+    '1098': {
+        'lines': [
+            "Form 1098 Mortgage Interest Statement",
+            "Lender: Sample Mortgage Company",
+            "1 Mortgage interest received from payer(s)/borrower(s) {mortgage_interest}",
+        ],
+        'fields': {'mortgage_interest': (1000, 40000)}
+    },
+    'K-1': {
+        'lines': [
+            "Schedule K-1 (Form 1065)",
+            "Partnership: Sample Partners LP",
+            "Partner Distributive Share of Income {other}",
+        ],
+        'fields': {'other': (1000, 150000)}
+    }
+}
+
+FILLER_TEXT = ("Instructions for Recipient. Keep this copy for your records. "
+               "Report these amounts on your return as described in the instructions.")
+
+def make_truth(form, rng):
+    """Draw ground-truth values for one document."""
+    truth = {}
+    for field, (low, high) in FORM_TEMPLATES[form]['fields'].items():
+        if field == 'tax_paid':
+            # Withholding is drawn as a share of wages
+            truth[field] = round(truth['wages'] * rng.uniform(low, high), 2)
+        else:
+            truth[field] = round(rng.uniform(low, high), 2)
+    return truth
+
+def render_form_pdf(form, truth, pages):
+    """Build a digital PDF with the form on the first page and instruction pages after it."""
+    lines = [line.format(**{k: f"{v:,.2f}" for k, v in truth.items()}) for line in FORM_TEMPLATES[form]['lines']]
+    doc = fitz.open()
+    for page_num in range(pages):
+        page = doc.new_page()
+        if page_num == 0:
+            page.insert_text((72, 72), "\n".join(lines), fontsize=12, lineheight=2)
+        else:
+            page.insert_textbox(fitz.Rect(72, 72, 540, 720), f"Page {page_num + 1} of {pages}. {FILLER_TEXT}", fontsize=11)
+    pdf_bytes = doc.tobytes()
+    doc.close()
+    return pdf_bytes
+
+def add_noise(image, noise, rng):
+    """Add Gaussian pixel noise, with noise as a fraction of the full intensity range."""
+    if noise <= 0:
+        return image
+    pixels = np.asarray(image, dtype=np.float32)
+    noise_rng = np.random.default_rng(rng.randrange(2 ** 32))
+    pixels += noise_rng.normal(0, noise * 255, pixels.shape)
+    return Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8))
+
+def rasterize_pdf(pdf_bytes, noise, rng, dpi=SCAN_DPI):
+    """Render each page of a PDF to a noisy grayscale image, as a scanner would."""
+    images = []
+    with fitz.open(stream=pdf_bytes, filetype="pdf") as doc:
+        for page in doc:
+            pixmap = page.get_pixmap(dpi=dpi, colorspace=fitz.csGRAY)
+            image = Image.frombytes("L", (pixmap.width, pixmap.height), pixmap.samples)
+            images.append(add_noise(image, noise, rng))
+    return images
+
+def images_to_pdf(images):
+    """Build an image-only PDF with no text layer."""
+    buffer = io.BytesIO()
+    images[0].save(buffer, format='PDF', save_all=True, append_images=images[1:], resolution=SCAN_DPI)
+    return buffer.getvalue()
+
+def build_corpus(kinds, forms, page_counts, noise_levels, per_case, seed):
+    """Generate the benchmark documents. Returns a list of cases, each with its documents."""
+    rng = random.Random(seed)
+    cases = []
+    for kind in kinds:
+        for form in forms:
+            # Images are single pages, and digital PDFs have no scan noise
+            for pages in (page_counts if kind != 'image' else [1]):
+                for noise in (noise_levels if kind != 'digital' else [0.0]):
+                    documents = []
+                    for _ in range(per_case):
+                        truth = make_truth(form, rng)
+                        pdf_bytes = render_form_pdf(form, truth, pages)
+                        if kind == 'digital':
+                            payload = pdf_bytes
+                        else:
+                            images = rasterize_pdf(pdf_bytes, noise, rng)
+                            payload = images_to_pdf(images) if kind == 'scanned' else images[0]
+                        documents.append({'truth': truth, 'payload': payload})
+                    cases.append({
+                        'name': f"{kind}/{form}/{pages}p/noise{noise:g}",
+                        'kind': kind, 'form': form, 'pages': pages, 'noise': noise,
+                        'documents': documents
+                    })
+    return cases
+
+def extract(kind, payload):
+    """Run the extraction stage for one document. Returns the extracted text."""
+    if kind == 'image':
+        return process_image(payload.copy())
+    return process_pdf(payload)
+
+def extracted_values(tax_doc):
+    """Flatten a TaxDocument's totals into the field names used by the ground truth."""
+    # Income keys win where the names overlap ('other'); no form here fills other deductions
+    values = dict(tax_doc.deductions)
+    values.update(tax_doc.income)
+    values['tax_paid'] = tax_doc.tax_paid
+    return values
+
+def run_document(kind, payload, truth):
+    """Process one document. Returns (extract_seconds, parse_seconds, correct_fields, error)."""
+    start_time = time.perf_counter()
+    text = extract(kind, payload)
+    extract_seconds = time.perf_counter() - start_time
+    if not text or text.startswith(("ERROR:", "OCR ERROR:")):
+        return extract_seconds, 0.0, 0, text or "No text extracted"
+
+    start_time = time.perf_counter()
+    tax_doc = TaxDocument()
+    tax_doc.process_text(text)
+    parse_seconds = time.perf_counter() - start_time
+
+    values = extracted_values(tax_doc)
+    correct = sum(abs(values.get(field, 0) - expected) < 0.01 for field, expected in truth.items())
+    return extract_seconds, parse_seconds, correct, None
+
+def summarize(samples):
+    """Latency summary in milliseconds."""
+    samples = sorted(samples)
+    return {
+        'mean_ms': round(statistics.fmean(samples) * 1000, 3),
+        'p50_ms': round(samples[len(samples) // 2] * 1000, 3),
+        'p95_ms': round(samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1000, 3),
+        'max_ms': round(samples[-1] * 1000, 3)
+    }
+
+def stage_snapshot():
+    """Copy the (seconds, observations) totals of each pipeline stage timing."""
+    with pipeline_stats_lock:
+        return {stage: (h['sum'], h['count']) for stage, h in stage_timings.items()}
+
+def stage_breakdown(before, after, documents):
+    """Per-stage timings recorded between two snapshots."""
+    stages = {}
+    for stage, (seconds, count) in sorted(after.items()):
+        seconds -= before.get(stage, (0.0, 0))[0]
+        count -= before.get(stage, (0.0, 0))[1]
+        if count:
+            stages[stage] = {
+                'observations': count,
+                'mean_ms': round(seconds / count * 1000, 3),
+                'ms_per_document': round(seconds / documents * 1000, 3)
+            }
+    return stages
+
+def current_rss():
+    """Resident set size of this process in bytes, or None where it cannot be read."""
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+class RssSampler:
+    """Tracks the peak RSS of this process while the with-block runs.
+    
+    RSS covers the native buffers of PIL, PyMuPDF, poppler and torch that
+    tracemalloc cannot see. It is sampled on a background thread, and freed
+    heap memory is handed back to the OS first (on glibc) so the growth of
+    one case does not depend on the cases before it.
+    """
+    
+    def __init__(self, interval=RSS_SAMPLE_SECONDS):
+        self.interval = interval
+        self.start_rss = self.peak_rss = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+    
+    def _update(self):
+        rss = current_rss()
+        if rss is not None and (self.peak_rss is None or rss > self.peak_rss):
+            self.peak_rss = rss
+    
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self._update()
+    
+    def __enter__(self):
+        if malloc_trim is not None:
+            malloc_trim(0)
+        self.start_rss = self.peak_rss = current_rss()
+        self._thread.start()
+        return self
+    
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        self._update()
+    
+    @property
+    def growth(self):
+        """Peak RSS above the RSS at the start, in bytes, or None if RSS could not be read."""
+        if self.start_rss is None or self.peak_rss is None:
+            return None
+        return self.peak_rss - self.start_rss
+
+def run_case(case, repeat):
+    """Benchmark one case. Timing runs are separate from the memory run, whose sampling thread adds overhead."""
+    extract_times, parse_times = [], []
+    correct_fields = total_fields = correct_documents = 0
+    errors = []
+
+    before = stage_snapshot()
+    for _ in range(repeat):
+        for document in case['documents']:
+            extract_seconds, parse_seconds, correct, error = run_document(case['kind'], document['payload'], document['truth'])
+            extract_times.append(extract_seconds)
+            parse_times.append(parse_seconds)
+            total_fields += len(document['truth'])
+            correct_fields += correct
+            correct_documents += correct == len(document['truth'])
+            if error and error not in errors:
+                errors.append(error)
+    pipeline_stages = stage_breakdown(before, stage_snapshot(), len(extract_times))
+
+    with RssSampler() as memory:
+        for document in case['documents']:
+            run_document(case['kind'], document['payload'], document['truth'])
+
+    documents = len(extract_times)
+    total_seconds = sum(extract_times) + sum(parse_times)
+    result = {
+        'kind': case['kind'], 'form': case['form'], 'pages': case['pages'], 'noise': case['noise'],
+        'documents': documents,
+        'stages': {
+            'extract': summarize(extract_times),
+            'parse': summarize(parse_times),
+            'total': summarize([e + p for e, p in zip(extract_times, parse_times)])
+        },
+        'pipeline_stages': pipeline_stages,
+        'peak_rss_kb': round(memory.peak_rss / 1024, 1) if memory.peak_rss is not None else None,
+        'rss_growth_kb': round(memory.growth / 1024, 1) if memory.growth is not None else None,
+        'documents_per_minute': round(documents / total_seconds * 60, 1) if total_seconds > 0 else None,
+        'field_accuracy': round(correct_fields / total_fields, 4) if total_fields else None,
+        'document_accuracy': round(correct_documents / documents, 4) if documents else None
+    }
+    if errors:
+        result['errors'] = errors[:3]
+    return result
+
+def compare(results, baseline, tolerance):
+    """Return a list of regressions of results against a baseline report."""
+    regressions = []
+    for name, case in results['cases'].items():
+        base = baseline.get('cases', {}).get(name)
+        if base is None:
+            continue
+        base_ms = base['stages']['total']['mean_ms']
+        new_ms = case['stages']['total']['mean_ms']
+        if base_ms > 0 and new_ms > base_ms * (1 + tolerance):
+            regressions.append(f"{name}: mean latency {base_ms:.2f} ms -> {new_ms:.2f} ms")
+        base_kb = base.get('rss_growth_kb')
+        new_kb = case.get('rss_growth_kb')
+        if base_kb is not None and new_kb is not None and new_kb > max(base_kb * (1 + tolerance), base_kb + MEMORY_SLACK_KB):
+            regressions.append(f"{name}: memory growth {base_kb:.0f} KB -> {new_kb:.0f} KB")
+        if (case['field_accuracy'] or 0) < (base['field_accuracy'] or 0):
+            regressions.append(f"{name}: field accuracy {base['field_accuracy']:.2%} -> {case['field_accuracy']:.2%}")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the document pipeline on synthetic tax forms.')
+    parser.add_argument('--output', default='benchmark_results.json', help='Where to write the JSON report (default benchmark_results.json)')
+    parser.add_argument('--compare', help='Baseline JSON report to check for speed and accuracy regressions')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed slowdown and memory growth against the baseline (default 0.2 = 20%%)')
+    parser.add_argument('--kinds', default=','.join(KINDS), help='Document kinds to generate (default digital,scanned,image)')
+    parser.add_argument('--forms', default=','.join(FORM_TEMPLATES), help='Forms to generate (default all)')
+    parser.add_argument('--pages', default='1,3,10', help='Page counts for PDF documents (default 1,3,10)')
+    parser.add_argument('--noise', default='0,0.05,0.15', help='Scan noise levels for scanned and image documents (default 0,0.05,0.15)')
+    parser.add_argument('--documents', type=int, default=5, help='Documents generated per case (default 5)')
+    parser.add_argument('--repeat', type=int, default=3, help='Timing passes over each case (default 3)')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed for the generated values (default 0)')
+    parser.add_argument('--log-level', default='WARNING', help='Log level for the pipeline while benchmarking (default WARNING)')
+    args = parser.parse_args(argv)
+
+    logging.getLogger('app').setLevel(args.log_level.upper())
+    logger.setLevel(logging.INFO)
+
+    if not PYMUPDF_AVAILABLE:
+        logger.error("PyMuPDF is required to generate the benchmark documents")
+        return 1
+
+    kinds = [kind for kind in args.kinds.split(',') if kind]
+    unknown = [kind for kind in kinds if kind not in KINDS] + [form for form in args.forms.split(',') if form not in FORM_TEMPLATES]
+    if unknown:
+        logger.error("Unknown kinds or forms: %s", ', '.join(unknown))
+        return 1
+
+    capabilities = get_engine_capabilities()
+    ocr_available = capabilities['tesseract']['available'] or capabilities['easyocr']['available']
+    skipped = []
+    if not ocr_available:
+        skipped = [kind for kind in kinds if kind != 'digital']
+        kinds = [kind for kind in kinds if kind == 'digital']
+        if skipped:
+            logger.warning("No OCR engine available, skipping %s documents", ', '.join(skipped))
+
+    start_time = time.time()
+    cases = build_corpus(kinds, args.forms.split(','),
+                         [int(p) for p in args.pages.split(',')],
+                         [float(n) for n in args.noise.split(',')],
+                         args.documents, args.seed)
+    logger.info("Generated %d documents in %d cases in %.2f seconds",
+                sum(len(case['documents']) for case in cases), len(cases), time.time() - start_time)
+
+    results = {
+        'version': BENCHMARK_VERSION,
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'tesseract': capabilities['tesseract']['version'],
+            'easyocr': capabilities['easyocr']['available'],
+            'pymupdf': capabilities['pymupdf']['version'],
+            'ocr_processes': int(os.environ.get('OCR_PROCESSES', 0)),
+            'easyocr_batch_size': int(os.environ.get('EASYOCR_BATCH_SIZE', 32))
+        },
+        'settings': {
+            'documents': args.documents, 'repeat': args.repeat, 'seed': args.seed,
+            'pages': args.pages, 'noise': args.noise, 'skipped_kinds': skipped
+        },
+        'cases': {}
+    }
+
+    for case in cases:
+        result = run_case(case, args.repeat)
+        results['cases'][case['name']] = result
+        logger.info("%s: %.2f ms/document, %s KB memory growth, %.0f%% fields correct",
+                    case['name'], result['stages']['total']['mean_ms'], result['rss_growth_kb'],
+                    result['field_accuracy'] * 100)
+
+    all_results = list(results['cases'].values())
+    documents = sum(result['documents'] for result in all_results)
+    total_ms = sum(result['stages']['total']['mean_ms'] * result['documents'] for result in all_results)
+    results['summary'] = {
+        'documents': documents,
+        'documents_per_minute': round(documents / (total_ms / 60000), 1) if total_ms > 0 else None,
+        'field_accuracy': round(statistics.fmean(result['field_accuracy'] for result in all_results), 4) if all_results else None
+    }
+    logger.info("%d documents, %s documents/minute, %s mean field accuracy",
+                documents, results['summary']['documents_per_minute'], results['summary']['field_accuracy'])
+
+    output_dir = os.path.dirname(args.output)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    logger.info("Wrote %s", args.output)
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        for regression in regressions:
+            logger.error("Regression: %s", regression)
+        if regressions:
+            return 1
+        logger.info("No regressions against %s", args.compare)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -169,24 +169,29 @@ document.addEventListener('DOMContentLoaded', function() {
             formData.append('tax_status', window.taxSelect.value);
             console.log('Tax status selected:', window.taxSelect.value);
             
-            // Add timeout to prevent indefinite loading
-            const timeoutPromise = new Promise((_, reject) => {
-                setTimeout(() => reject(new Error('Request timed out after 60 seconds')), 60000);
-            });
+            // Give up polling if the job takes longer than 5 minutes
+            const deadline = Date.now() + 300000;
             
-            // Submit the form with timeout
+            // Submit the upload; the server queues a job and returns its ID immediately
             console.log('Sending upload request to /upload...');
-            Promise.race([
-                fetch('/upload', {
-                    method: 'POST',
-                    body: formData
-                }),
-                timeoutPromise
-            ])
+            fetch('/upload', {
+                method: 'POST',
+                body: formData
+            })
             .then(function(response) {
                 console.log('Received response with status:', response.status);
                 return response.json();
             })
+            .then(function(job) {
+                if (job.error) {
+                    return job;
+                }
+                console.log('Queued job:', job.job_id);
+                if (window.EventSource && job.events_url) {
+                    return streamJob(job, deadline, overlay);
+                }
+                return pollJob(job, deadline, overlay);
+            })
             .then(function(data) {
                 // Hide loading
                 document.body.removeChild(overlay);
@@ -313,6 +318,113 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     }
     
+    // Follow a job's progress events as they happen, then fetch its result.
+    // Falls back to polling if the event stream cannot be opened or drops.
+    function streamJob(job, deadline, overlay) {
+        const processingText = overlay.querySelector('.processing-text');
+        
+        return new Promise(function(resolve, reject) {
+            const source = new EventSource(job.events_url);
+            let finished = false;
+            
+            function setText(text) {
+                if (processingText) {
+                    processingText.textContent = text;
+                }
+            }
+            
+            function finish() {
+                finished = true;
+                source.close();
+                clearTimeout(timer);
+            }
+            
+            const timer = setTimeout(function() {
+                finish();
+                reject(new Error('Processing timed out after 5 minutes'));
+            }, Math.max(0, deadline - Date.now()));
+            
+            source.addEventListener('queued', function() {
+                setText('Waiting for an available worker...');
+            });
+            source.addEventListener('running', function() {
+                setText('Processing your documents...');
+            });
+            source.addEventListener('file', function(e) {
+                const event = JSON.parse(e.data);
+                setText(`Reading ${event.file} (${event.index} of ${event.total})...`);
+            });
+            source.addEventListener('page', function(e) {
+                const event = JSON.parse(e.data);
+                const method = event.method === 'text' || event.method === 'pypdf2' ? 'text layer' : event.method;
+                setText(`Read page ${event.page} of ${event.file} (${method})`);
+            });
+            source.addEventListener('document', function(e) {
+                const event = JSON.parse(e.data);
+                setText(`Found ${event.document_type} in ${event.file}. Income so far: ${formatCurrency(event.total_income)}`);
+            });
+            source.addEventListener('file_error', function(e) {
+                const event = JSON.parse(e.data);
+                console.warn('Error processing file:', event.file, event.error);
+            });
+            
+            function done(e) {
+                const event = JSON.parse(e.data);
+                finish();
+                fetch(event.result_url)
+                    .then(function(response) { return response.json(); })
+                    .then(resolve, reject);
+            }
+            source.addEventListener('completed', done);
+            source.addEventListener('failed', done);
+            
+            source.onerror = function() {
+                if (finished) {
+                    return;
+                }
+                console.warn('Progress stream closed, polling for the result instead');
+                finish();
+                pollJob(job, deadline, overlay).then(resolve, reject);
+            };
+        });
+    }
+    
+    // Poll a queued job until it finishes, then fetch its result
+    function pollJob(job, deadline, overlay) {
+        const processingText = overlay.querySelector('.processing-text');
+        
+        return new Promise(function(resolve, reject) {
+            function check() {
+                if (Date.now() > deadline) {
+                    reject(new Error('Processing timed out after 5 minutes'));
+                    return;
+                }
+                
+                fetch(job.status_url)
+                    .then(function(response) { return response.json(); })
+                    .then(function(status) {
+                        if (status.error && status.status !== 'failed') {
+                            resolve(status);
+                        } else if (status.status === 'completed' || status.status === 'failed') {
+                            fetch(job.result_url)
+                                .then(function(response) { return response.json(); })
+                                .then(resolve, reject);
+                        } else {
+                            if (processingText) {
+                                processingText.textContent = status.status === 'queued'
+                                    ? 'Waiting for an available worker...'
+                                    : 'Processing your documents...';
+                            }
+                            setTimeout(check, 1000);
+                        }
+                    })
+                    .catch(reject);
+            }
+            
+            check();
+        });
+    }
+    
     // Helper function to format currency
     function formatCurrency(value) {
         if (typeof value === 'string') {